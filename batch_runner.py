@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Batch runner agent: runs on a worker host and plays many jobs (games) sent by ClusterManager in batch mode over a single
+SSH channel, instead of one exec_command + SFTP round trip per game from the coordinator.
+
+Jobs are read from stdin as JSON lines:
+    {"id": ..., "command": ..., "required_files": {remote path: base64 data}, "return_files": [remote path, ...]}
+
+Each job is run in its own temporary directory (/tmp/cluster_instance_*) with a pool of --workers concurrent jobs, and
+one JSON line is written to stdout per job, as soon as it finishes (not in order):
+    {"id": ..., "exit_code": ..., "out": base64, "err": base64, "secs": ..., "score": ...,
+     "files": {remote path: base64 data or null if missing}}
+
+The agent only uses the Python standard library, as it is shipped to the hosts together with the core package.
+"""
+__author__ = "Sebastian Sardina, Marco Tamassia, and Nir Lipovetzky"
+__copyright__ = "Copyright 2017-2020"
+__license__ = "GPLv3"
+
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_ROOT_DIR = "/tmp"
+SCORE_FILE = "score"  # left by capture.py in the game directory
+
+output_lock = threading.Lock()
+
+
+def _encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def _read_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def run_job(spec):
+    """
+    Runs one job spec in a fresh directory and returns its result record.
+    """
+    job_dir = tempfile.mkdtemp(prefix="cluster_instance_", dir=JOBS_ROOT_DIR)
+    try:
+        for remote_path, data in spec.get("required_files", {}).items():
+            with open(os.path.join(job_dir, remote_path), "wb") as f:
+                f.write(base64.b64decode(data))
+
+        time_start = time.time()
+        process = subprocess.Popen(
+            ["sh", "-c", spec["command"]],
+            cwd=job_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        out, err = process.communicate()
+        secs = round(time.time() - time_start)
+
+        files = {}
+        for remote_path in spec.get("return_files", []):
+            data = _read_file(os.path.join(job_dir, remote_path))
+            files[remote_path] = None if data is None else _encode(data)
+        score = _read_file(os.path.join(job_dir, SCORE_FILE))
+
+        return {
+            "id": spec["id"],
+            "exit_code": process.returncode,
+            "out": _encode(out),
+            "err": _encode(err),
+            "secs": secs,
+            "score": None if score is None else score.decode("utf-8", "replace").strip(),
+            "files": files,
+        }
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def run_and_report(spec):
+    try:
+        result = run_job(spec)
+    except Exception as e:
+        result = {
+            "id": spec.get("id"),
+            "exit_code": -1,
+            "out": "",
+            "err": _encode(str(e).encode("utf-8")),
+            "secs": 0,
+            "score": None,
+            "files": {},
+        }
+    with output_lock:
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs jobs given as JSON lines in stdin and streams their results as JSON lines to stdout."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="number of jobs to run concurrently."
+    )
+    args = parser.parse_args()
+
+    # each job is a separate (sh) process, the pool threads just wait for them
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for line in sys.stdin:
+            if line.strip():
+                pool.submit(run_and_report, json.loads(line))
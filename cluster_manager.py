@@ -15,10 +15,20 @@ __license__ = "GPLv3"
 
 from collections import namedtuple
 from queue import Queue
+import heapq
+import threading
 import random
 from time import sleep
 import os
 import datetime
+import hashlib
+import zipfile
+import json
+import base64
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
 from joblib import Parallel, delayed
 from getpass import getpass, getuser
 
@@ -42,9 +52,11 @@ logging.getLogger("paramiko").setLevel(logging.WARNING)
 # ----------------------------------------------------------------------------------------------------------------------
 # Import class from helper module
 
+# executor is how jobs are run in the host (see EXECUTORS): "ssh" in a remote host, "local" as local processes or
+#   "container" as local containers of the given image (hostname/username/... are only used by "ssh")
 Host = namedtuple(
     "Host",
-    ["no_cpu", "hostname", "username", "password", "key_filename", "key_password"],
+    ["no_cpu", "hostname", "username", "password", "key_filename", "key_password", "executor", "image"],
     verbose=False,
 )
 Job = namedtuple(
@@ -54,18 +66,70 @@ TransferableFile = namedtuple(
     "TransferableFile", ["local_path", "remote_path"], verbose=False
 )
 
-# Keep track of the number of total jobs to run and number of jobs completed (for reporting)
+# Keep track of the number of total jobs to run and number of jobs completed (for reporting); each job is counted once,
+#   when finished for good (see ClusterManager._job_finished), so a job failed and then retried is not counted as failed
 no_total_jobs = 0
 no_successful_jobs = 0
 no_failed_jobs = 0
+no_skipped_jobs = 0  # not run, as their outcome was already decided (see ClusterManager.start(skip=...))
 time_games = []  # list of seconds, one per game finished
 time_start = datetime.datetime.now()
 
 CORE_PACKAGE_DIR = "/tmp/pacman_files"
+# Unpacks a core package zip into a read-only, content-hashed directory (done in a temporary dir and then renamed, so
+# a half unpacked directory is never used); older unpacked packages (and their manifests) are then removed, leaving
+# the mode of their files alone, as the new package may share them as hard links. Files are made read-only, as each
+# game copies what it needs from there (the executable bit mirrors the old "chmod +x -R *" done before every game).
+UNPACK_CORE_PACKAGE_COMMAND = (
+    "[ -d {unpack_dir} ] || {{ mkdir -p {core_dir} ; rm -rf {unpack_dir}.tmp ; "
+    "unzip -oq {zip_file} -d {unpack_dir}.tmp && "
+    "find {unpack_dir}.tmp -type f -exec chmod a+x,a-w {{}} + && "
+    "mv {unpack_dir}.tmp {unpack_dir} ; }} ; "
+    "[ -d {unpack_dir} ] && for d in {core_dir}/* ; do case \"$d\" in {unpack_dir}|{unpack_dir}.manifest) ;; "
+    "*) find \"$d\" -type d -exec chmod u+w {{}} + ; rm -rf \"$d\" ;; esac ; done"
+)
+# Same, but building the directory from an older unpacked package (base_dir) already in the host, plus a delta zip
+# with the files changed since then: the new directory starts as hard links to base_dir, the files changed or removed
+# (listed in removed_file) are unlinked, so the base_dir files are never written, and the delta is unzipped on top.
+UNPACK_CORE_PACKAGE_DELTA_COMMAND = (
+    "[ -d {unpack_dir} ] || {{ rm -rf {unpack_dir}.tmp ; "
+    "cp -al {base_dir} {unpack_dir}.tmp && "
+    "( cd {unpack_dir}.tmp && xargs -r -d '\\n' rm -f < {removed_file} ) && "
+    "{{ [ ! -s {zip_file} ] || unzip -oq {zip_file} -d {unpack_dir}.tmp ; }} && "
+    "find {unpack_dir}.tmp -type f -exec chmod a+x,a-w {{}} + && "
+    "mv {unpack_dir}.tmp {unpack_dir} ; }} ; "
+    "[ -d {unpack_dir} ] && for d in {core_dir}/* ; do case \"$d\" in {unpack_dir}|{unpack_dir}.manifest) ;; "
+    "*) find \"$d\" -type d -exec chmod u+w {{}} + ; rm -rf \"$d\" ;; esac ; done"
+)
+MANIFEST_SUFFIX = ".manifest"  # {unpack_dir}.manifest has the hash of each file in {unpack_dir}, to send only deltas
+# Checks that a package already unpacked in a host still has the files of its manifest, and only those, before it is
+#   reused: games run as the same user, so a team could have modified it (and with it every later game in the host)
+VERIFY_CORE_PACKAGE_COMMAND = (
+    "cd {unpack_dir} && sha1sum --quiet --strict -c {check_file} > /dev/null 2>&1 && "
+    "[ \"$(find . -type f | wc -l)\" -eq {no_files} ]"
+)
+# Removes every package unpacked in a host (e.g., after one was found modified, as the rest may share its files)
+REMOVE_CORE_PACKAGES_COMMAND = (
+    "find {core_dir} -type d -exec chmod u+w {{}} + ; rm -rf {core_dir}/*"
+)
 NO_LOCAL_RETRIES = (
     1  # Number of retries when a remote command failed (e.g., connection lost)
 )
 NO_GLOBAL_TRIES = 2
+SKIPPED_EXIT_CODE = -2  # exit code of a job not run because its outcome was already decided (see start(skip=...))
+# Exit codes of the timeout command when a job ran past its deadline (SIGTERM, or SIGKILL if it did not stop): the job
+#   is finished, not failed, so its result files are fetched and it is not retried (see contest_runner.with_timeout)
+DEADLINE_EXIT_CODES = (124, 137)
+# Worker slots (CPUs) of a host sharing one SSH connection; each slot may have an exec and an SFTP channel open, so
+#   this keeps the sessions per connection under sshd's default MaxSessions (10)
+SLOTS_PER_CONNECTION = 4
+SSH_KEEPALIVE_SECS = 30
+# Agent run in each host in batch mode (shipped with the core package)
+BATCH_RUNNER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch_runner.py")
+BATCH_RUNNER_REMOTE_FILE = "/tmp/pacman_batch_runner.py"
+# Runs a job command in a container: /tmp is shared so the job dir and the core package dir are both in the container,
+#   and the host user is kept so the core package files stay read-only for the game
+CONTAINER_COMMAND = ["docker", "run", "--rm", "--user", "{uid}:{gid}", "-v", "/tmp:/tmp", "-w", "{job_dir}", "{image}"]
 
 
 class ErrorInGame(Exception):
@@ -73,12 +137,20 @@ class ErrorInGame(Exception):
 
 
 class ClusterManager:
-    def __init__(self, hosts, jobs, core_req_file=None):
+    def __init__(self, hosts, jobs, core_req_file=None, batch=False, journal=None):
+        """
+        :param batch: if True, each host runs its jobs through one batch runner agent (see batch_runner.py) fed with
+        jobs over a single channel and streaming their results back, instead of one exec_command + SFTP per job.
+        :param journal: if given, each attempt of a job is recorded in it as it starts (journal.job_started(job,
+        try_no)) and finishes (journal.job_finished(job, try_no, result)); see job_journal.ContestJournal
+        """
         self.hosts = hosts  # type: 'List[Host]'
         self.jobs = jobs  # type: 'List[Job]'
-        self.workers = []  # type: 'List[SSHClient]'
-        self.pool = Queue()  # type: 'Queue[SSHClient]'
+        self.journal = journal
+        self.workers = []  # type: 'List[Worker]'
+        self.pool = Queue()  # type: 'Queue[Worker]'
         self.no_tries = NO_LOCAL_RETRIES
+        self.batch = batch
 
         total_no_workers = sum(host.no_cpu for host in hosts)
         # https: // pythonhosted.org / joblib / generated / joblib.Parallel.html
@@ -86,74 +158,108 @@ class ClusterManager:
         global no_total_jobs
         global no_failed_jobs
         global no_successful_jobs
+        global no_skipped_jobs
 
         no_total_jobs = len(self.jobs)
         no_successful_jobs = 0
         no_failed_jobs = 0
+        no_skipped_jobs = 0
         logging.info(
             "ABOUT TO RUN %d jobs in %d hosts (%d CPUs) #####################"
             % (no_total_jobs, len(hosts), total_no_workers)
         )
 
-        # Firsts, authenticate abd build all workers (each Hostname + core gives a worker)
-        self.workers = Parallel(total_no_workers, backend="threading")(
-            delayed(create_worker)(host)
-            for host in self.hosts
-            for _ in range(host.no_cpu)
-        )
+        # Firsts, authenticate and build all workers (each Hostname + core gives a worker), through the executor of
+        #  each host (e.g., the SSH workers of a host share a few connections)
+        self.executors = [create_executor(host) for host in self.hosts]
+        self.workers = [
+            worker
+            for host_workers in Parallel(len(self.hosts), backend="threading")(
+                delayed(executor.create_workers)(batch) for executor in self.executors
+            )
+            for worker in host_workers
+        ]
+        if batch:
+            core_req_file = list(core_req_file or []) + [
+                TransferableFile(
+                    local_path=BATCH_RUNNER_FILE, remote_path=BATCH_RUNNER_REMOTE_FILE
+                )
+            ]
 
-        # Second, transfer the required core files to each hostname, if any
+        # Second, prepare each host with the required core files, if any
         #  (this is good because there there will be many less than workers, just one per IP)
         logging.info("FIRST COPYING REQUIRED FILES TO HOSTS....")
         if not core_req_file is None:
             Parallel(len(self.hosts), backend="threading")(
-                delayed(transfer_core_package)(
-                    host.hostname, self.workers, core_req_file
-                )
-                for host in self.hosts
+                delayed(executor.prepare_host)(core_req_file)
+                for executor in self.executors
             )
 
         # Put all workers in pool
         for worker in self.workers:
             self.pool.put(worker)
 
-    def start(self):
+    def start(self, callback=None, skip=None):
+        """
+        Runs all the jobs in the workers.
+        :param callback: if given, callback(job, result) is called as soon as each job is finished for good (from the
+        scheduler thread of the worker that ran it, so it has to be thread-safe), e.g., to process its result while
+        other jobs are still running
+        :param skip: if given, skip(job) is called before running each job (from the scheduler threads too), and if
+        True the job is not run but finished straight away with exit code SKIPPED_EXIT_CODE, e.g., if its outcome
+        is already decided by the results of the jobs run so far
+        :return: the results of the jobs, in the order given: job.data, exit_code, result_out, result_err, job_secs_taken
+        """
         global time_start
+        global no_failed_jobs
         time_start = datetime.datetime.now()
-        jobs_list = self.jobs
-
-        results = (
-            []
-        )  # list of results: job.data, exit_code, result_out, result_err, job_secs_taken
-        try_no = 0
-        while jobs_list:
-            try_no = try_no + 1
-            results_run = Parallel(self.pool.qsize(), backend="threading")(
-                delayed(run_job)(self.pool, job) for job in jobs_list
-            )
 
-            if try_no < NO_GLOBAL_TRIES:
-                games_failed = [
-                    job_data
-                    for job_data, exit_code, _, _, _ in results_run
-                    if exit_code == -1
-                ]
-                jobs_list = [
-                    j for j in jobs_list if j.data in games_failed
-                ]  # extract failed jobs (to retry)
-                good_results = [
-                    tuple(result) for result in results_run if not result[1] == -1
-                ]
-                results = (
-                    results + good_results
-                )  # keep non-error results only (rest will be re-tried)
-                print(
-                    "============================ ONE FULL PASS ON JOBS COMPLETED ============================"
+        # Shared priority queue of pending jobs: entries are (priority, try_no, job); the priority is the position of
+        # the job in the list given, so jobs are dispatched in order. A failed job is put straight back with its try
+        # number increased (up to NO_GLOBAL_TRIES), so there is no barrier between retry passes anymore.
+        self.queue = []  # type: 'List[Tuple[int, int, Job]]'
+        self.queue_cond = threading.Condition()
+        self.no_pending_jobs = len(self.jobs)  # jobs not yet finished for good (queued or running)
+        self.results = {}  # priority -> result of the job
+        self.callback = callback
+        self.skip = skip
+        for priority, job in enumerate(self.jobs):
+            heapq.heappush(self.queue, (priority, 1, job))
+
+        # One long-lived scheduler thread per worker; each pulls the next job from the queue when free
+        workers = [self.pool.get() for _ in range(self.pool.qsize())]
+        threads = [
+            threading.Thread(
+                target=self._schedule_on_host_batch
+                if self.batch and worker.executor.supports_batch
+                else self._schedule_on_worker,
+                args=(worker,),
+            )
+            for worker in workers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # if all workers were lost, the jobs still queued are failed
+        for priority, try_no, job in self.queue:
+            self.results[priority] = (job.data, -1, "", "Match did not work: no workers left", 1)
+            self._report_result(job, self.results[priority])
+            no_failed_jobs += 1
+        if no_skipped_jobs or self.queue:
+            report_progress()  # the last jobs may have been skipped or lost, with no progress reported for them
+        for executor in self.executors:
+            try:
+                executor.teardown()
+            except Exception as e:
+                logging.warning(
+                    "Could not tear down host {}: {}".format(executor.hostname, str(e))
                 )
-            else:
-                # tough luck, include failed jobs in results as they came with score = -1 (failed)...
-                results = results + results_run
-                break
+        for thread_worker in self.workers:
+            self.pool.put(thread_worker)
+
+        # list of results: job.data, exit_code, result_out, result_err, job_secs_taken
+        results = [self.results[priority] for priority in sorted(self.results)]
 
         if len(time_games) > 0:
             avg_secs_game = round(sum(time_games) / len(time_games), 0)
@@ -170,14 +276,436 @@ class ClusterManager:
         )
         return results
 
+    def _next_job(self, block=True):
+        """
+        Blocks until a job is available and pops it from the queue, or returns None if all jobs are finished.
+        If block is False, returns None straight away when no job is queued. Jobs to be skipped are finished as they
+        are popped.
+        """
+        while True:
+            with self.queue_cond:
+                while block and not self.queue and self.no_pending_jobs > 0:
+                    # nothing queued but some job is still running and may fail and come back to the queue
+                    self.queue_cond.wait()
+                if not self.queue:
+                    return None
+                entry = heapq.heappop(self.queue)
+            priority, try_no, job = entry
+            if self._skipped(job):
+                logging.debug("Job {} skipped: its outcome is already decided".format(job.id))
+                self._job_finished(
+                    priority, try_no, job, (job.data, SKIPPED_EXIT_CODE, "", "Match skipped", 0)
+                )
+                continue
+            if self.journal is not None:
+                self.journal.job_started(job, try_no)
+            return entry
+
+    def _skipped(self, job):
+        if self.skip is None:
+            return False
+        try:
+            return self.skip(job)
+        except Exception as e:
+            logging.error("Could not tell whether to skip job {}: {}".format(job.id, str(e)))
+            return False
+
+    def _schedule_on_worker(self, worker):
+        while True:
+            entry = self._next_job()
+            if entry is None:
+                break
+            priority, try_no, job = entry
+
+            try:
+                result = run_job(worker, job)
+            except Exception as e:
+                # e.g., worker could not even reconnect; never leave the job pending or the scheduler would hang
+                logging.error(
+                    "Job {} could not be run in worker {}: {}".format(
+                        job.id, worker.hostname, str(e)
+                    )
+                )
+                result = (job.data, -1, "", "Match did not work: {}".format(str(e)), 1)
+
+            self._job_finished(priority, try_no, job, result)
+
+    def _schedule_on_host_batch(self, worker):
+        """
+        Keeps up to worker.no_cpu jobs running in the host of the worker through one batch runner agent (see
+        batch_runner.py), sending it jobs from the shared queue as their results stream back.
+        """
+        in_flight = {}  # key sent to the runner -> (priority, try_no, job)
+        no_sent = 0
+        while True:
+            try:
+                runner_stdin, runner_stdout, _ = worker.exec_command(
+                    "python3 %s --workers %d" % (BATCH_RUNNER_REMOTE_FILE, worker.no_cpu)
+                )
+                while True:
+                    # top up the runner; only wait for a job if there is nothing running
+                    while len(in_flight) < worker.no_cpu:
+                        entry = self._next_job(block=not in_flight)
+                        if entry is None:
+                            break
+                        no_sent += 1
+                        in_flight[str(no_sent)] = entry
+                        runner_stdin.write(batch_job_spec(str(no_sent), entry[2]) + "\n")
+                        runner_stdin.flush()
+                        logging.info(
+                            "ABOUT TO RUN JOB in host %s (batch): %s"
+                            % (worker.hostname, report_match(entry[2]))
+                        )
+                    if not in_flight:
+                        break  # all jobs are finished
+
+                    line = runner_stdout.readline()
+                    if not line:
+                        raise ErrorInGame(
+                            "Batch runner in host {} exited".format(worker.hostname)
+                        )
+                    record = json.loads(line)
+                    priority, try_no, job = in_flight.pop(record["id"])
+                    self._job_finished(
+                        priority, try_no, job, collect_batch_result(worker, job, record)
+                    )
+                runner_stdin.close()
+                return
+            except Exception as e:
+                logging.error(
+                    "Batch runner FAILED in host {} (will reconnect & retry): {}".format(
+                        worker.hostname, str(e)
+                    )
+                )
+                for priority, try_no, job in in_flight.values():
+                    self._job_finished(
+                        priority,
+                        try_no,
+                        job,
+                        (job.data, -1, "", "Match did not work: {}".format(str(e)), 1),
+                    )
+                in_flight.clear()
+                try:
+                    worker.reconnect()
+                except Exception as e:
+                    logging.error(
+                        "Host {} lost, no more jobs will run there: {}".format(
+                            worker.hostname, str(e)
+                        )
+                    )
+                    return
+
+    def _job_finished(self, priority, try_no, job, result):
+        global no_successful_jobs
+        global no_failed_jobs
+        global no_skipped_jobs
+
+        if self.journal is not None:
+            self.journal.job_finished(job, try_no, result)
+        retry = result[1] == -1 and try_no < NO_GLOBAL_TRIES
+        if not retry:
+            # success or tough luck: failed jobs are included as they came with score = -1 (failed)...
+            #   (reported before the job stops being pending, so start() does not return before it is processed)
+            self._report_result(job, result)
+        with self.queue_cond:
+            if retry:
+                logging.info(
+                    "Job {} failed in try {}, putting it back in the queue".format(
+                        job.id, try_no
+                    )
+                )
+                heapq.heappush(self.queue, (priority, try_no + 1, job))
+            else:
+                self.results[priority] = tuple(result)
+                self.no_pending_jobs -= 1
+                if result[1] == SKIPPED_EXIT_CODE:
+                    no_skipped_jobs += 1
+                elif result[1] == -1:
+                    no_failed_jobs += 1
+                else:
+                    no_successful_jobs += 1
+            self.queue_cond.notify_all()
+        if result[1] != SKIPPED_EXIT_CODE:
+            report_progress()  # skipped jobs are many and take no time: reported at the end (see start())
+
+    def _report_result(self, job, result):
+        if self.callback is None:
+            return
+        try:
+            self.callback(job, result)
+        except Exception as e:
+            logging.error(
+                "Result of job {} could not be processed: {}\n{}".format(
+                    job.id, str(e), traceback.format_exc()
+                )
+            )
+
+
+class HostConnection:
+    """
+    One SSH connection (i.e., paramiko Transport) to a host, shared by several worker slots that open their own
+    channels on it. The connection is kept alive and transparently re-established if it drops.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.hostname = host.hostname
+        self.lock = threading.Lock()
+        self.client = create_worker(host)  # type: SSHClient
+
+    def get_client(self):
+        with self.lock:
+            return self.client
+
+    def reconnect(self, failed_client):
+        """
+        Re-establishes the connection after failed_client failed, unless another slot did it already.
+        """
+        with self.lock:
+            if self.client is not failed_client:
+                return  # some other slot reconnected already
+            transport = self.client.get_transport()
+            if transport is not None and transport.is_active():
+                return  # the connection is fine, the failure was in the channel
+            logging.warning("Reconnecting to host %s..." % self.hostname)
+            self.client.close()
+            self.client = create_worker(self.host)
+
+
+class Worker:
+    """
+    A worker slot (one CPU of a host) running one job at a time on a connection shared with other slots of the host.
+    """
+
+    def __init__(self, connection, slot_no, no_cpu=1):
+        self.connection = connection  # type: HostConnection
+        self.hostname = connection.hostname
+        self.slot_no = slot_no
+        self.no_cpu = no_cpu  # jobs run at a time through this worker (more than one only in batch mode)
+        self.executor = None  # type: SSHExecutor
+        self.sftp = None  # long-lived SFTP session of this slot (see get_sftp())
+        self.sftp_client = None  # the SSHClient the SFTP session was opened on
+        self.pending_cleanup = []  # job dirs to be removed before the next job of this slot runs
+
+    def exec_command(self, command, **kwargs):
+        return self.connection.get_client().exec_command(command, **kwargs)
+
+    def open_sftp(self):
+        return self.connection.get_client().open_sftp()
+
+    def get_sftp(self):
+        """
+        Returns the SFTP session of this slot, (re)opening it if it is not healthy: its channel was closed or the
+        connection was re-established. The check is local, it costs no round trip.
+        """
+        client = self.connection.get_client()
+        if self.sftp is not None:
+            channel = self.sftp.get_channel()
+            if (
+                self.sftp_client is client
+                and channel is not None
+                and not channel.closed
+                and channel.get_transport().is_active()
+            ):
+                return self.sftp
+            logging.debug("Reopening SFTP session of worker in host %s" % self.hostname)
+            try:
+                self.sftp.close()
+            except Exception:
+                pass
+        self.sftp = client.open_sftp()
+        self.sftp_client = client
+        return self.sftp
+
+    def clean_up(self):
+        """
+        Removes the directories of the last jobs run in this slot, if any.
+        """
+        if self.pending_cleanup:
+            self.exec_command("rm -rf %s" % " ".join(self.pending_cleanup))
+            self.pending_cleanup = []
+
+    def reconnect(self):
+        self.connection.reconnect(self.connection.get_client())
+
+
+class LocalWorker:
+    """
+    A worker slot running jobs as local processes, without SSH, in a process pool shared by the slots of the host.
+    """
+
+    def __init__(self, executor, slot_no):
+        self.executor = executor  # type: LocalExecutor
+        self.hostname = executor.hostname
+        self.slot_no = slot_no
+        self.no_cpu = 1
+
+    def reconnect(self):
+        pass
+
+
+class Executor:
+    """
+    Runs jobs in a host: creates its worker slots, prepares the host with the core package, runs jobs in it and fetches
+    their result files, and tears the host down at the end. Subclasses implement each way of running jobs.
+    """
+
+    supports_batch = False  # whether the workers can run jobs through a batch runner agent (batch mode)
+
+    def __init__(self, host):
+        self.host = host
+        self.hostname = host.hostname
+        self.workers = []
+
+    def create_workers(self, batch=False):
+        """
+        Creates the worker slots of the host (host.no_cpu, or a single one running them all in batch mode).
+        """
+        raise NotImplementedError
+
+    def prepare_host(self, required_files):
+        """
+        Leaves the required files in the host, unpacking zip files once into core_package_dir().
+        """
+        raise NotImplementedError
+
+    def run_job(self, worker, job):
+        """
+        Runs the job in its own directory and fetches its return files.
+        :return: job.data, exit_code, result_out, result_err, job_secs_taken
+        :raises ErrorInGame: if the job failed
+        """
+        raise NotImplementedError
+
+    def teardown(self):
+        pass
+
+
+class SSHExecutor(Executor):
+    """
+    Runs jobs in a remote host over SSH; worker slots share one connection each SLOTS_PER_CONNECTION slots.
+    """
+
+    supports_batch = True
+
+    def create_workers(self, batch=False):
+        # connections are opened one after the other so the host sees one handshake at a time (MaxStartups)
+        #  In batch mode there is a single worker per host, running host.no_cpu jobs at a time
+        if batch:
+            self.workers = [Worker(HostConnection(self.host), 0, self.host.no_cpu)]
+        else:
+            self.workers = []
+            for slot_no in range(self.host.no_cpu):
+                if slot_no % SLOTS_PER_CONNECTION == 0:
+                    connection = HostConnection(self.host)
+                self.workers.append(Worker(connection, slot_no))
+        for worker in self.workers:
+            worker.executor = self
+        logging.info(
+            "Host %s connected: %d workers over %d connections"
+            % (
+                self.hostname,
+                len(self.workers),
+                len(set(worker.connection for worker in self.workers)),
+            )
+        )
+        return self.workers
+
+    def prepare_host(self, required_files):
+        transfer_core_package(self.hostname, self.workers, required_files)
+
+    def run_job(self, worker, job):
+        return run_job_on_worker(worker, job)
+
+    @staticmethod
+    def fetch_results(worker, job, dest_dir):
+        sftp = worker.get_sftp()
+        for tf in job.return_files:
+            sftp.get(localpath=tf.local_path, remotepath=os.path.join(dest_dir, tf.remote_path))
+
+    def teardown(self):
+        for worker in self.workers:
+            worker.clean_up()
+
+
+class LocalExecutor(Executor):
+    """
+    Runs jobs as processes of the local host (no SSH), in a pool of host.no_cpu processes.
+    """
+
+    def __init__(self, host):
+        super().__init__(host)
+        self.hostname = host.hostname or host.executor
+        self.process_pool = None
+        self.container_image = None  # image to run each job in, if any
+
+    def create_workers(self, batch=False):
+        self.process_pool = ProcessPoolExecutor(self.host.no_cpu)
+        self.workers = [LocalWorker(self, slot_no) for slot_no in range(self.host.no_cpu)]
+        return self.workers
+
+    def prepare_host(self, required_files):
+        prepare_local_core_package(required_files)
+
+    def run_job(self, worker, job):
+        result = self.process_pool.submit(
+            run_job_locally, job, os.getcwd(), self.container_image
+        ).result()
+        time_games.append(result[4])
+        return result
+
+    @staticmethod
+    def fetch_results(job, dest_dir, local_dir):
+        for tf in job.return_files:
+            shutil.copy(
+                os.path.join(dest_dir, tf.remote_path),
+                os.path.join(local_dir, tf.local_path),
+            )
+
+    def teardown(self):
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
+
+
+class ContainerExecutor(LocalExecutor):
+    """
+    Runs jobs in local containers of the image of the host (e.g., with the Python version and packages of the cluster).
+    """
+
+    def __init__(self, host):
+        super().__init__(host)
+        if not host.image:
+            raise ValueError("Container executor needs an image (e.g., python:3.6)")
+        self.container_image = host.image
+
+
+EXECUTORS = {"ssh": SSHExecutor, "local": LocalExecutor, "container": ContainerExecutor}
+
+
+def create_executor(host):
+    return EXECUTORS[host.executor or "ssh"](host)
+
+
+_ssh_config = None
+
+
+def _load_ssh_config():
+    # ~/.ssh/config is parsed once, not per connection
+    global _ssh_config
+    if _ssh_config is None:
+        config = SSHConfig()
+        if os.path.exists(os.path.expanduser("~/.ssh/config")):
+            with open(os.path.expanduser("~/.ssh/config")) as f:
+                config.parse(f)
+        _ssh_config = config
+    return _ssh_config
+
 
 def create_worker(host):
-    config = SSHConfig()
+    config = _load_ssh_config()
     proxy = None
-    if os.path.exists(os.path.expanduser("~/.ssh/config")):
-        config.parse(open(os.path.expanduser("~/.ssh/config")))
-        if host.hostname is not None and "proxycommand" in config.lookup(host.hostname):
-            proxy = ProxyCommand(config.lookup(host.hostname)["proxycommand"])
+    if host.hostname is not None and "proxycommand" in config.lookup(host.hostname):
+        proxy = ProxyCommand(config.lookup(host.hostname)["proxycommand"])
 
     # proxy = paramiko.ProxyCommand("ssh -o StrictHostKeyChecking=no e62439@131.170.5.132 nc 118.138.239.241 22")
 
@@ -206,11 +734,172 @@ def create_worker(host):
         pkey=worker.pkey,
         sock=proxy,
     )
+    worker.get_transport().set_keepalive(SSH_KEEPALIVE_SECS)
 
     return worker
 
 
-# Transfer the core package and leave it in /tmp/pacman_files
+_manifests = {}  # (zip path, size, mtime) -> manifest, so each core package zip is hashed once per run
+
+
+def package_manifest(zip_file_path):
+    """
+    Returns the manifest of a zip file: the sha1 hash of the content of each file in it, by file name.
+    """
+    stat = os.stat(zip_file_path)
+    key = (os.path.abspath(zip_file_path), stat.st_size, stat.st_mtime)
+    if key not in _manifests:
+        manifest = {}
+        with zipfile.ZipFile(zip_file_path) as zip_file:
+            for info in zip_file.infolist():
+                if not info.filename.endswith("/"):
+                    manifest[info.filename] = hashlib.sha1(zip_file.read(info)).hexdigest()
+        _manifests[key] = manifest
+    return _manifests[key]
+
+
+def package_hash(zip_file_path):
+    """
+    Hashes the content (names and data of the files) of a zip file; unlike hashing the zip file itself, the hash does
+    not change when the same files are zipped again.
+    """
+    digest = hashlib.sha1()
+    for name, file_hash in sorted(package_manifest(zip_file_path).items()):
+        digest.update(name.encode("utf-8"))
+        digest.update(file_hash.encode("ascii"))
+    return digest.hexdigest()
+
+
+def core_package_dir(zip_file_path):
+    """
+    Returns the remote directory where the zip file is unpacked by transfer_core_package (e.g., /tmp/pacman_files/<hash>)
+    A job then copies from there the files it needs into its own dir (see contest_runner.sandbox_command)
+    """
+    return os.path.join(CORE_PACKAGE_DIR, package_hash(zip_file_path))
+
+
+def _find_base_package(sftp, manifest):
+    """
+    Finds the unpacked core package in a host that shares the most files with the one to be sent (of given manifest).
+    :return: (unpack dir, manifest) of the package, or (None, None) if there is no package with manifest in the host
+    """
+    base_dir, base_manifest, base_no_shared = None, None, 0
+    try:
+        file_names = sftp.listdir(CORE_PACKAGE_DIR)
+    except IOError:
+        return base_dir, base_manifest
+    for file_name in file_names:
+        if not file_name.endswith(MANIFEST_SUFFIX):
+            continue
+        unpack_dir = os.path.join(CORE_PACKAGE_DIR, file_name[: -len(MANIFEST_SUFFIX)])
+        try:
+            with sftp.open(os.path.join(CORE_PACKAGE_DIR, file_name), "r") as f:
+                host_manifest = json.loads(f.read().decode("utf-8"))
+            sftp.stat(unpack_dir)
+        except (IOError, ValueError):
+            continue
+        no_shared = len(manifest.items() & host_manifest.items())
+        if no_shared > base_no_shared:
+            base_dir, base_manifest, base_no_shared = unpack_dir, host_manifest, no_shared
+    return base_dir, base_manifest
+
+
+def _write_package_delta(zip_file_path, base_manifest, delta_file_path, removed_file_path):
+    """
+    Writes a zip with the files of zip_file_path that are new or changed with respect to base_manifest, and the list of
+    files of the base package that are changed or removed (to be unlinked before unzipping the delta).
+    :return: number of files in the delta, number of files to be unlinked
+    """
+    manifest = package_manifest(zip_file_path)
+    changed = [
+        name for name, file_hash in manifest.items() if base_manifest.get(name) != file_hash
+    ]
+    removed = [
+        name for name, file_hash in base_manifest.items() if manifest.get(name) != file_hash
+    ]
+    if changed:
+        with zipfile.ZipFile(zip_file_path) as zip_file, zipfile.ZipFile(
+            delta_file_path, "w", zipfile.ZIP_DEFLATED
+        ) as delta_file:
+            for name in changed:
+                info = zip_file.getinfo(name)
+                delta_file.writestr(info, zip_file.read(info))
+    else:
+        open(delta_file_path, "wb").close()  # empty: nothing to unzip
+    with open(removed_file_path, "w") as f:
+        f.write("".join(name + "\n" for name in removed))
+    return len(changed), len(removed)
+
+
+def _transfer_package_delta(worker, sftp, tf, unpack_dir):
+    """
+    Sends the core package zip tf to the host of the worker as a delta on the unpacked package most similar to it in
+    the host (or the whole zip if none), and unpacks it into unpack_dir.
+    """
+    hostname = worker.hostname
+    base_dir, base_manifest = _find_base_package(sftp, package_manifest(tf.local_path))
+    if base_dir is None:
+        sftp.put(localpath=tf.local_path, remotepath=tf.remote_path)
+        command = UNPACK_CORE_PACKAGE_COMMAND.format(
+            core_dir=CORE_PACKAGE_DIR, unpack_dir=unpack_dir, zip_file=tf.remote_path
+        )
+    else:
+        local_dir = tempfile.mkdtemp(prefix="core_package_delta_")
+        try:
+            delta_file = os.path.join(local_dir, "delta.zip")
+            removed_file = os.path.join(local_dir, "removed")
+            no_changed, no_removed = _write_package_delta(
+                tf.local_path, base_manifest, delta_file, removed_file
+            )
+            logging.info(
+                "Core package delta for host %s on %s: %d files new or changed, %d removed or changed (%d of %d bytes)"
+                % (
+                    hostname,
+                    base_dir,
+                    no_changed,
+                    no_removed,
+                    os.path.getsize(delta_file),
+                    os.path.getsize(tf.local_path),
+                )
+            )
+            sftp.put(localpath=delta_file, remotepath=tf.remote_path)
+            sftp.put(localpath=removed_file, remotepath=tf.remote_path + ".removed")
+        finally:
+            shutil.rmtree(local_dir, ignore_errors=True)
+        command = UNPACK_CORE_PACKAGE_DELTA_COMMAND.format(
+            core_dir=CORE_PACKAGE_DIR,
+            unpack_dir=unpack_dir,
+            base_dir=base_dir,
+            zip_file=tf.remote_path,
+            removed_file=tf.remote_path + ".removed",
+        )
+
+    _, ssh_stdout, ssh_stderr = worker.exec_command(command)
+    if not ssh_stdout.channel.recv_exit_status() == 0:
+        raise ErrorInGame(
+            "Could not unpack core package in host {}: {}".format(
+                hostname, ssh_stderr.read()
+            )
+        )
+    with sftp.open(unpack_dir + MANIFEST_SUFFIX, "w") as f:
+        f.write(json.dumps(package_manifest(tf.local_path)))
+
+
+def _manifest_check_list(manifest):
+    """
+    :return: the manifest of a package as a sha1sum check list (see VERIFY_CORE_PACKAGE_COMMAND)
+    """
+    return "".join("%s  %s\n" % (file_hash, name) for name, file_hash in sorted(manifest.items()))
+
+
+def _verify_command(unpack_dir, check_file, manifest):
+    return VERIFY_CORE_PACKAGE_COMMAND.format(
+        unpack_dir=unpack_dir, check_file=check_file, no_files=len(manifest)
+    )
+
+
+# Transfer the core package and unpack the zip files, once per host, into /tmp/pacman_files/<hash>; only the files
+#   changed since the package already unpacked in the host (if any) are sent
 def transfer_core_package(hostname, workers, required_files):
     # Find a worker for this hostname and transfer the required files to des_dir
     for worker in workers:
@@ -221,28 +910,78 @@ def transfer_core_package(hostname, workers, required_files):
             logging.info("[START] CORE PACKAGE TRANSFERED TO HOST %s\n" % hostname)
             sftp = worker.open_sftp()
             for tf in required_files:
-                sftp.put(localpath=tf.local_path, remotepath=tf.remote_path)
+                if not tf.local_path.endswith(".zip"):
+                    sftp.put(localpath=tf.local_path, remotepath=tf.remote_path)
+                    continue
+
+                unpack_dir = core_package_dir(tf.local_path)
+                try:
+                    sftp.stat(unpack_dir)
+                except IOError:  # not there yet
+                    _transfer_package_delta(worker, sftp, tf, unpack_dir)
+                    continue
+                manifest = package_manifest(tf.local_path)
+                with sftp.open(tf.remote_path + ".check", "w") as f:
+                    f.write(_manifest_check_list(manifest))
+                _, ssh_stdout, _ = worker.exec_command(
+                    _verify_command(unpack_dir, tf.remote_path + ".check", manifest)
+                )
+                if ssh_stdout.channel.recv_exit_status() == 0:
+                    logging.info(
+                        "Core package %s already unpacked in host %s"
+                        % (unpack_dir, hostname)
+                    )
+                    continue
+                logging.warning(
+                    "Core package %s in host %s was modified: unpacking it again" % (unpack_dir, hostname)
+                )
+                _, ssh_stdout, _ = worker.exec_command(
+                    REMOVE_CORE_PACKAGES_COMMAND.format(core_dir=CORE_PACKAGE_DIR)
+                )
+                ssh_stdout.channel.recv_exit_status()
+                _transfer_package_delta(worker, sftp, tf, unpack_dir)
             sftp.close()
             logging.info("[END] CORE PACKAGE TRANSFERED TO HOST %s\n" % hostname)
             break
     return
 
 
-def run_job(pool, job):
-    global no_successful_jobs
-    global no_failed_jobs
-    global no_total_jobs
+# Leave the core package in the local machine, as transfer_core_package does in a remote host
+def prepare_local_core_package(required_files):
+    for tf in required_files:
+        if not tf.local_path.endswith(".zip"):
+            shutil.copy(tf.local_path, tf.remote_path)
+            continue
+        unpack_dir = core_package_dir(tf.local_path)
+        if os.path.isdir(unpack_dir):
+            manifest = package_manifest(tf.local_path)
+            with tempfile.NamedTemporaryFile("w", suffix=".check") as check_file:
+                check_file.write(_manifest_check_list(manifest))
+                check_file.flush()
+                intact = subprocess.call(_verify_command(unpack_dir, check_file.name, manifest), shell=True) == 0
+            if not intact:
+                logging.warning("Core package %s was modified: unpacking it again" % unpack_dir)
+                subprocess.call(REMOVE_CORE_PACKAGES_COMMAND.format(core_dir=CORE_PACKAGE_DIR), shell=True)
+        subprocess.check_call(
+            UNPACK_CORE_PACKAGE_COMMAND.format(
+                core_dir=CORE_PACKAGE_DIR,
+                unpack_dir=core_package_dir(tf.local_path),
+                zip_file=os.path.abspath(tf.local_path),
+            ),
+            shell=True,
+        )
+    logging.info("CORE PACKAGE PREPARED IN LOCAL HOST")
+
 
-    #  worker is a SSHClient
-    worker = pool.get()
+def run_job(worker, job):
+    #  worker is a Worker slot
 
     # We tried NO_RETRIES time - and then give up....
     for i in range(NO_LOCAL_RETRIES):
         try:
             # time.sleep(randint(1, 10))
             # TODO: does not work when filename has a ' like Sebcant'code
-            result_job_on_worker = run_job_on_worker(worker, job)
-            no_successful_jobs += 1
+            result_job_on_worker = worker.executor.run_job(worker, job)
         # TODO: this captures any error that may happen when doing the job in the worker. Is it enough?
         except ErrorInGame as e:
             # Somehow some games the zip does no uncompress well.....
@@ -255,7 +994,6 @@ def run_job(pool, job):
                 # sleep(4)
                 continue
             else:
-                no_failed_jobs += 1
                 logging.error(
                     "I am giving up local retying job {} in worker {}, too many local failures...".format(
                         job.id, worker.hostname
@@ -275,38 +1013,91 @@ def run_job(pool, job):
                 )
             )
             traceback.print_exc()
-            worker.close()
-            worker.connect(
-                hostname=worker.hostname,
-                username=worker.username,
-                password=worker.password,
-                pkey=worker.pkey,
-                sock=worker.proxy,
-            )
+            worker.reconnect()
             if i < NO_LOCAL_RETRIES - 1:  # i is zero indexed
                 continue
             else:
-                no_failed_jobs += 1
                 logging.error("I am giving up on job %s" % str(job.id))
                 result_job_on_worker = job.data, -1, "", "Match did not work", 1
         break
+
+    return result_job_on_worker
+
+
+def report_progress():
     games_played = no_successful_jobs + no_failed_jobs
-    games_left = no_total_jobs - no_successful_jobs
+    games_left = no_total_jobs - no_successful_jobs - no_failed_jobs - no_skipped_jobs
     secs_so_far = (datetime.datetime.now() - time_start).total_seconds()
-    est_time_left = round((games_left * secs_so_far) / games_played, 0)
+    # skipped jobs take no time, so the time left is estimated on the jobs run only
+    est_time_left = round((games_left * secs_so_far) / games_played, 0) if games_played else 0
     logging.info(
-        "Jobs COMPLETED: (%d successful, %d failed) of %d total games (%d games left; estimated time left: %s)"
+        "Jobs COMPLETED: (%d successful, %d failed, %d skipped) of %d total games (%d games left; estimated time "
+        "left: %s)"
         % (
             no_successful_jobs,
             no_failed_jobs,
+            no_skipped_jobs,
             no_total_jobs,
             games_left,
             str(datetime.timedelta(seconds=est_time_left)),
         )
     )
 
-    pool.put(worker)
-    return result_job_on_worker
+
+def batch_job_spec(key, job):
+    """
+    Encodes a job as a JSON line for the batch runner agent (see batch_runner.py), under the given key.
+    """
+    required_files = {}
+    for tf in job.required_files:
+        with open(tf.local_path, "rb") as f:
+            required_files[tf.remote_path] = base64.b64encode(f.read()).decode("ascii")
+    return json.dumps(
+        {
+            "id": key,
+            "command": job.command,
+            "required_files": required_files,
+            "return_files": [tf.remote_path for tf in job.return_files],
+        }
+    )
+
+
+def collect_batch_result(worker, job, record):
+    """
+    Saves the files returned by the batch runner for a job and builds the job result, as run_job() does.
+    """
+    error = None
+    if not (record["exit_code"] == 0 or record["exit_code"] in DEADLINE_EXIT_CODES):
+        error = "Error in running game - exit code: {}".format(record["exit_code"])
+    for tf in job.return_files:
+        data = record["files"].get(tf.remote_path)
+        if data is None:
+            error = error or "File {} not returned".format(tf.remote_path)
+            continue
+        with open(tf.local_path, "wb") as f:
+            f.write(base64.b64decode(data))
+
+    if error is None:
+        time_games.append(record["secs"])
+        logging.info(
+            "FINISHED GAME in host %s (%s time taken; batch): %s"
+            % (worker.hostname, record["secs"], report_match(job))
+        )
+        result = (
+            job.data,
+            record["exit_code"],
+            base64.b64decode(record["out"]),
+            base64.b64decode(record["err"]),
+            record["secs"],
+        )
+    else:
+        logging.error(
+            "Job with ID {} has FAILED in host {} (batch): {}".format(
+                job.id, worker.hostname, error
+            )
+        )
+        result = (job.data, -1, "", "Match did not work: {}".format(error), 1)
+    return result
 
 
 def report_progress_bytes_transfered(xfer, to_be_xfer, job_id):
@@ -338,20 +1129,33 @@ def _rmdir(sftp, path):
 def run_job_on_worker(worker, job):
     global max_secs_game
 
-    #  worker is an SSHClient
+    #  worker is a Worker slot
 
     # create remote env
-    instance_id = "".join(random.choice("0123456789abcdef") for _ in range(30))
-    instance_id = "{}-{}".format(
-        job.id.replace(" ", "_"), datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    # each job has its own directory (the random suffix keeps it unique even for a retry of the same job in the same
+    #   second), so concurrent games in a host never share their working files (e.g., replay-0 and log-0)
+    instance_id = "{}-{}-{}".format(
+        job.id.replace(" ", "_"),
+        datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S"),
+        "".join(random.choice("0123456789abcdef") for _ in range(8)),
     )
     dest_dir = "/tmp/cluster_instance_{}".format(instance_id)
+    try:
+        return _run_job_in_dir(worker, job, dest_dir)
+    finally:
+        # the directory of the job, even if it failed, is cleaned when the next job runs in the worker (or at the end)
+        worker.pending_cleanup.append(dest_dir)
+
 
+def _run_job_in_dir(worker, job, dest_dir):
+    """
+    Runs the job in dest_dir in the host of the worker and fetches its return files, as per run_job_on_worker.
+    """
     logging.info(
         "ABOUT TO RUN JOB in host %s (%s): %s"
         % (worker.hostname, dest_dir, report_match(job))
     )
-    sftp = worker.open_sftp()
+    sftp = worker.get_sftp()
     try:
         sftp.mkdir(dest_dir)
     except IOError:  # dir already exists!
@@ -370,8 +1174,6 @@ def run_job_on_worker(worker, job):
         _rmdir(sftp, dest_dir)
         sftp.mkdir(dest_dir)
 
-    sftp.chdir(dest_dir)
-
     # copy core package into the temporary dir for this particular job
     # worker.exec_command('cp -a %s/* %s' % (CORE_PACKAGE_DIR, dest_dir))
     # logging.debug('GAME PREPARED AND COPIED in host %s (%s): %s' % (worker.hostname, dest_dir, report_match(job)))
@@ -381,7 +1183,7 @@ def run_job_on_worker(worker, job):
     for tf in job.required_files:
         # sftp.put(localpath=tf.local_path, remotepath=tf.remote_path,
         #          callback=lambda x, y: report_progress_bytes_transfered(x, y, str(job.id)))
-        sftp.put(localpath=tf.local_path, remotepath=tf.remote_path)
+        sftp.put(localpath=tf.local_path, remotepath=os.path.join(dest_dir, tf.remote_path))
 
     logging.debug(
         "ABOUT TO EXECUTE command in host %s dir %s: %s"
@@ -390,12 +1192,15 @@ def run_job_on_worker(worker, job):
     # run job
     startTime = datetime.datetime.now()
     actual_command = """cd %s ; sh -c '%s'""" % (dest_dir, job.command)
+    if worker.pending_cleanup:
+        # clean the directories of the previous jobs in the same command, saving a channel and a round trip
+        actual_command = "rm -rf %s ; %s" % (" ".join(worker.pending_cleanup), actual_command)
     try:
-        # TODO: do we want to put a timeout here in case the call does not return? some pacman games take 3 min eh
-        # _, ssh_stdout, ssh_stderr = worker.exec_command(actual_command, timeout=60, get_pty=True)  # Non-blocking call
+        # the call returns once the job is done: the deadline of the game is enforced by the job command itself
         _, ssh_stdout, ssh_stderr = worker.exec_command(
             actual_command, get_pty=True
         )  # Non-blocking call
+        worker.pending_cleanup = []  # removed by the command (left for the next one if it could not be run)
         result_out = ssh_stdout.read()
         result_err = ssh_stderr.read()
         exit_code = (
@@ -403,7 +1208,7 @@ def run_job_on_worker(worker, job):
         )  # Blocking call but only after reading it all
         # if random.randint(0, 10) > 5: # to force failure!
         #     exit_code = -1
-        if not exit_code == 0:
+        if not (exit_code == 0 or exit_code in DEADLINE_EXIT_CODES):
             raise ErrorInGame("Error in running game - cmd: {}".format(actual_command))
     except ErrorInGame:
         raise
@@ -428,13 +1233,7 @@ def run_job_on_worker(worker, job):
         % (worker.hostname, dest_dir, report_match(job))
     )
     # Retrieve replay file
-    for tf in job.return_files:
-        # print(tf)
-        sftp.get(localpath=tf.local_path, remotepath=tf.remote_path)
-    sftp.close()
-
-    # clean temporary directory for game
-    worker.exec_command("rm -rf %s" % dest_dir)
+    SSHExecutor.fetch_results(worker, job, dest_dir)
 
     logging.info(
         "FINISHED GAME in host %s (%s time taken; %s): %s"
@@ -448,10 +1247,55 @@ def run_job_on_worker(worker, job):
     return job.data, exit_code, result_out, result_err, job_secs_taken
 
 
+def run_job_locally(job, local_dir, container_image=None):
+    """
+    Runs a job in its own local temporary directory (in a process of a LocalExecutor pool), inside a container of
+    container_image if given; relative local paths of the job files are taken from local_dir. The result is as per
+    run_job_on_worker.
+    """
+    dest_dir = tempfile.mkdtemp(prefix="cluster_instance_", dir="/tmp")
+    try:
+        for tf in job.required_files:
+            shutil.copy(os.path.join(local_dir, tf.local_path), os.path.join(dest_dir, tf.remote_path))
+
+        command = ["sh", "-c", job.command]
+        if container_image is not None:
+            command = [
+                arg.format(uid=os.getuid(), gid=os.getgid(), job_dir=dest_dir, image=container_image)
+                for arg in CONTAINER_COMMAND
+            ] + command
+
+        startTime = datetime.datetime.now()
+        process = subprocess.Popen(
+            command,
+            cwd=dest_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        result_out, result_err = process.communicate()
+        exit_code = process.returncode
+        if not (exit_code == 0 or exit_code in DEADLINE_EXIT_CODES):
+            raise ErrorInGame("Error in running game - cmd: {}".format(job.command))
+        job_secs_taken = (
+            datetime.datetime.now().replace(microsecond=0)
+            - startTime.replace(microsecond=0)
+        ).total_seconds()
+
+        LocalExecutor.fetch_results(job, dest_dir, local_dir)
+    finally:
+        shutil.rmtree(dest_dir, ignore_errors=True)
+
+    logging.info(
+        "FINISHED GAME in local host (%s time taken; %s): %s"
+        % (job_secs_taken, dest_dir, report_match(job))
+    )
+    return job.data, exit_code, result_out, result_err, job_secs_taken
+
+
 if __name__ == "__main__":
     """
     Little demo:
-    - connects to localhost
+    - runs in the local host (no SSH)
     - executes for 10 times, using 2 processes in parallel, the following
       - copy the source of this script to the worker
       - sleep 1 second
@@ -460,16 +1304,20 @@ if __name__ == "__main__":
       - copy the file back to the directory of this script
     """
     hosts = [
-        # prompt for password (for password authentication or if private key is password protected)
         Host(
             no_cpu=2,
             hostname="localhost",
-            username=getuser(),
-            password=getpass(),
+            username=None,
+            password=None,
             key_filename=None,
+            key_password=None,
+            executor="local",
+            image=None,
         )
-        # use this if no pass is necessary (for private key authentication)
-        # Host(no_cpu=2, hostname='localhost', username=getuser(), password=None, key_filename=None)
+        # use this to connect to localhost via SSH, prompting for password (for password authentication or if private
+        #   key is password protected); use password=None if no pass is necessary (for private key authentication)
+        # Host(no_cpu=2, hostname='localhost', username=getuser(), password=getpass(), key_filename=None,
+        #      key_password=None, executor="ssh", image=None)
     ]
     jobs = []
     for i in range(10):
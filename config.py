@@ -20,6 +20,7 @@ DEFAULT_ORGANIZER = "Uni Pacman"
 DEFAULT_STATS_ARCHIVE_DIR = "stats-archive"
 DEFAULT_LOGS_ARCHIVE_DIR = "logs-archive"
 DEFAULT_REPLAYS_ARCHIVE_DIR = "replays-archive"
+DEFAULT_STATS_DB_FILE = "stats.db"  # in the stats archive dir: the stats of all runs, for cross-run queries
 
 TMP_DIR = "tmp"
 
@@ -40,11 +41,30 @@ TIMEZONE = timezone("Australia/Melbourne")
 CORE_CONTEST_TEAM_ZIP_FILE = "contest_and_teams.zip"
 SUBMISSION_FILENAME_PATTERN = re.compile(r"^(s\d+)(_([-+0-9T:.]+))?(\.zip)?$")
 AGENT_FACTORY = "myTeam.py"
+GAME_RUNNER_FILE = "run_game.py"  # runs capture.py and records the game outcome in GAME_RESULT_FILE
+GAME_RESULT_FILE = "result-0.json"
+
+# pre-flight game of each team before the contest, to find the teams that cannot even load (see MultiContest.preflight)
+PREFLIGHT_OPPONENT = "baselineTeam"
+PREFLIGHT_LAYOUT = "testCapture"
+PREFLIGHT_STEPS = 10
+TMP_PREFLIGHT_DIR = "preflight"
+# a team is taken as broken (and its remaining games forfeited) once it failed to load, and never loaded fine, in this
+#   many different layouts of the contest, so one failure that depends on the host does not decide (a team failing the
+#   pre-flight, where it is checked on purpose, is broken straight away)
+BROKEN_TEAM_FAILED_LAYOUTS = 2
+
+# wall-clock deadline of a game on the worker: once passed, the game is stopped (SIGTERM) and recorded as a timeout of
+#   the team moving then (see run_game.py), and killed for good (SIGKILL) if still running GAME_KILL_AFTER_SECS later
+GAME_SECS_PER_STEP = 1  # the time limit of each move
+GAME_TIMEOUT_MARGIN_SECS = 120  # loading the teams, their registerInitialState (15 secs per agent), and some slack
+GAME_KILL_AFTER_SECS = 10
 
 DEFAULT_MAX_STEPS = 1200
 DEFAULT_FIXED_LAYOUTS = 3
 DEFAULT_LAYOUTS_ZIP_FILE = os.path.join(DIR_SCRIPT, "layouts.zip")
 DEFAULT_RANDOM_LAYOUTS = 3
 DEFAULT_CONFIG_FILE = "config.json"
+DEFAULT_JOURNAL_DIR = "journal"
 
 DEFAULT_NO_SPLIT = 1
\ No newline at end of file
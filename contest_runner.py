@@ -4,24 +4,130 @@ import re
 import shutil
 import zipfile
 import glob
-import tarfile
 import subprocess
 import json
+import sqlite3
+import datetime
+import threading
 from itertools import combinations
 import logging
 from config import *
 
-from cluster_manager import ClusterManager, Job, Host, TransferableFile
+from cluster_manager import ClusterManager, Job, Host, TransferableFile, core_package_dir, package_manifest, \
+    SKIPPED_EXIT_CODE, DEADLINE_EXIT_CODES
+from duration_model import DurationModel, predict_makespan
+from result_cache import ResultCache, code_hashes, game_key
+from pacman_html_generator import LiveLeaderboard
+from game_archive import GameArchive, archive_file_name
+from stats_db import StatsDB
+from swiss_tournament import SwissTournament
+
+
+# line logged by the game runner when stopped at its deadline (see run_game.py), with the team moving then, if any
+DEADLINE_MOVING_REGEX = re.compile(r"Game stopped at its deadline \((red|blue) team moving\)")
+
+
+def _game_id(red_team_name, blue_team_name, layout):
+    # a game between two teams in a layout, no matter which team played red
+    return tuple(sorted([red_team_name, blue_team_name])) + (layout,)
+
+
+def game_team_stats(red_team_name, blue_team_name, layout, score, winner, totaltime):
+    """
+    Returns what a game (as stored in self.games) adds to the stats of each team ([points, wins, draws, losses,
+    errors, sum_score], as per _calculate_team_stats): a game with an error (ERROR_SCORE) is won by 1 by the team that
+    did not fail, if any, and counts as an error for the team(s) that failed.
+    """
+    if score == ERROR_SCORE and winner is None:
+        return {red_team_name: [0, 0, 0, 0, 1, 0], blue_team_name: [0, 0, 0, 0, 1, 0]}
+    if winner is None:
+        scores = {red_team_name: score, blue_team_name: score}
+        errors = {}
+    else:
+        loser = red_team_name if winner == blue_team_name else blue_team_name
+        errors = {loser: 1} if score == ERROR_SCORE else {}
+        if score == ERROR_SCORE:
+            score = 1
+        scores = {winner: score, loser: -score}
+
+    team_stats = {}
+    for team_name, team_score in scores.items():
+        wins, draws, losses = int(team_score > 0), int(team_score == 0), int(team_score < 0)
+        team_stats[team_name] = [
+            wins * 3 + draws,
+            wins,
+            draws,
+            losses,
+            errors.get(team_name, 0),
+            team_score,
+        ]
+    return team_stats
+
+
+def failed_on_start(record, team):
+    """
+    :param record: the record of a game left by the game runner (see run_game.py)
+    :param team: "red" or "blue"
+    :return: True if the team failed to load in the game, or crashed (not timed out) before its first move
+    """
+    return team in record["failed_to_load"] or (
+        record["crashed"] == team and not record["timeout"] and not record["steps"]
+    )
+
+
+def sandbox_command(core_dir, agent_factories):
+    """
+    :return: the command that sets up the dir of a game from the core package unpacked in the host (see
+    cluster_manager.core_package_dir): a writable copy of the platform and of the code of the teams playing only (not
+    hard links), so whatever a team writes, even to its own files, stays in the dir of the game
+    """
+    command = "tar -C {core_dir} --exclude=./{teams_dir} -cf - . | tar -xf -".format(
+        core_dir=core_dir, teams_dir=TEAMS_SUBDIR
+    )
+    for team_dir in sorted({os.path.dirname(agent_factory) for agent_factory in agent_factories} - {""}):
+        command += ' && mkdir -p "{parent_dir}" && cp -r "{core_dir}/{team_dir}" "{parent_dir}"'.format(
+            core_dir=core_dir, team_dir=team_dir, parent_dir=os.path.dirname(team_dir) or "."
+        )
+    return command + " && chmod -R u+w ."
+
+
+def game_timeout(max_steps):
+    """
+    :return: the default wall-clock deadline (in seconds) of a game of max_steps steps
+    """
+    return GAME_TIMEOUT_MARGIN_SECS + max_steps * GAME_SECS_PER_STEP
+
+
+def with_timeout(command, secs):
+    """
+    :return: the command run under a deadline: once passed, its whole process group is sent SIGTERM (see run_game.py),
+    and SIGKILL GAME_KILL_AFTER_SECS later if still running
+    """
+    return "timeout --kill-after={kill_after} {secs} {command}".format(
+        kill_after=GAME_KILL_AFTER_SECS, secs=secs, command=command
+    )
+
+
+def _add_team_stats(team_stats, game):
+    for team_name, deltas in game_team_stats(*game).items():
+        if team_name in team_stats:
+            team_stats[team_name] = [stat + delta for stat, delta in zip(team_stats[team_name], deltas)]
 
 
 class ContestRunner:
     # submissions file format: s???????[_datetime].zip
     # submissions folder format: s???????[_datetime]
     # datetime in ISO8601 format:  https://en.wikipedia.org/wiki/ISO_8601
-    def __init__(self, settings):
+    def __init__(self, settings, journal=None):
+        """
+        :param journal: the JobJournal of the run, if any; if the run is being resumed from it, the games already
+        played (in tmp_dir) are kept and only the rest are played
+        """
 
         self.organizer = settings["organizer"]
         self.max_steps = settings["max_steps"]
+        # wall-clock deadline of each game, enforced on the worker, so a stuck agent does not hold a worker for good
+        self.game_timeout = settings.get("game_timeout") or game_timeout(self.max_steps)
 
         self.www_dir = settings["www_dir"]
         self.stats_archive_dir = os.path.join(
@@ -36,6 +142,10 @@ class ContestRunner:
             self.www_dir,
             settings.get("replays_archive_dir", None) or DEFAULT_REPLAYS_ARCHIVE_DIR,
         )
+        # database with the stats of all runs (the stats json of each run is still written)
+        self.stats_db_file = settings.get("stats_db") or os.path.join(
+            self.stats_archive_dir, DEFAULT_STATS_DB_FILE
+        )
 
         self.upload_replays = settings["upload_replays"]
         self.upload_logs = settings["upload_logs"]
@@ -49,6 +159,13 @@ class ContestRunner:
 
         # a flag indicating whether to compress the logs
         self.compress_logs = settings["compress_logs"]
+        # codec of the replays and logs archives, which are appended to as each game finishes (see GameArchive)
+        self.archive_codec = settings.get("archive_codec") or ("gzip" if self.compress_logs else "none")
+        self.replays_archive = None
+        self.logs_archive = None
+
+        # a flag indicating whether to run games through a batch runner agent in each host
+        self.batch_mode = settings.get("batch_mode", False)
 
         self.teams = settings["teams"] + settings["staff_teams"]
         self.staff_teams = settings["staff_teams"]
@@ -58,23 +175,89 @@ class ContestRunner:
         self.tmp_contest = os.path.join(self.tmp_dir, TMP_CONTEST_DIR)
         self.tmp_replays_dir = os.path.join(self.tmp_dir, TMP_REPLAYS_DIR)
         self.tmp_logs_dir = os.path.join(self.tmp_dir, TMP_LOGS_DIR)
+        self.core_req_file = None  # the core package zip to transfer to each host (set when run)
+        self.core_package_dir = None  # remote dir where the core package is unpacked in each host (set when run)
 
-        if os.path.exists(self.tmp_dir):
+        # the view of the journal for this contest, where the cluster records the jobs (see ClusterManager)
+        self.journal = (
+            None if journal is None else journal.for_contest(self.contest_timestamp_id)
+        )
+        # the run is resumed from the journal: the games played before it was interrupted are kept
+        self.resuming = journal is not None and journal.resumed
+
+        if os.path.exists(self.tmp_dir) and not self.resuming:
             shutil.rmtree(self.tmp_dir)
-        os.makedirs(self.tmp_dir)
+        os.makedirs(self.tmp_dir, exist_ok=True)
 
-        if os.path.exists(self.tmp_replays_dir):
+        if os.path.exists(self.tmp_replays_dir) and not self.resuming:
             shutil.rmtree(self.tmp_replays_dir)
-        os.makedirs(self.tmp_replays_dir)
+        os.makedirs(self.tmp_replays_dir, exist_ok=True)
 
-        if os.path.exists(self.tmp_logs_dir):
+        if os.path.exists(self.tmp_logs_dir) and not self.resuming:
             shutil.rmtree(self.tmp_logs_dir)
-        os.makedirs(self.tmp_logs_dir)
+        os.makedirs(self.tmp_logs_dir, exist_ok=True)
 
         self.ladder = {n: [] for n, _ in self.teams}
         self.games = []
         self.errors = {n: 0 for n, _ in self.teams}
         self.team_stats = {n: 0 for n, _ in self.teams}
+        self.analysis_lock = threading.Lock()  # games are analysed by the cluster threads as they finish
+
+        # teams that failed the pre-flight, or failed to load (or crashed on start) in BROKEN_TEAM_FAILED_LAYOUTS layouts
+        #   of the contest and never loaded fine: their remaining games are not played, but forfeited (see game_decided)
+        self.broken_teams = set(settings.get("preflight_failed_teams", []))
+        self.loaded_teams = set()
+        self.failed_layouts = {}  # team -> layouts where it failed to load so far
+
+        # live leaderboard refreshed (at most every live_interval seconds) as games finish, if an interval is given
+        self.live_interval = settings.get("live_interval")
+        self.live = None
+        self.live_team_stats = {}  # team stats of the games analysed so far, kept up to date for the live leaderboard
+
+        # model of game durations from past runs, used to dispatch the longest games first
+        self.duration_model = DurationModel(self.max_steps)
+        self._load_duration_model()
+        self.makespan = None  # predicted vs actual seconds to run all the games, once run
+
+        # cache of games played in past runs, reused when neither team code nor platform changed (if cache dir given)
+        self.result_cache = (
+            ResultCache(settings["cache_dir"]) if settings.get("cache_dir") else None
+        )
+        self.platform_hash = None  # content hashes of the platform and of each team code (set when run)
+        self.team_hashes = {}
+        self.no_cached_games = 0
+
+        # stats of a previous run whose games are kept, playing only those of new or updated teams (incremental mode)
+        self.incremental_from = settings.get("incremental_from")
+        self.previous_stats = None
+        self.no_previous_games = 0  # the first games in self.games are the ones kept from the previous run
+
+        # Swiss tournament played in rounds of sampled pairings, instead of a full round robin (if games per team given)
+        self.swiss = None
+        if settings.get("games_per_team"):
+            if self.staff_teams_vs_others_only or self.incremental_from is not None:
+                logging.warning("Games per team ignored: a Swiss tournament cannot be played only vs staff teams or "
+                                "continue a previous run")
+            else:
+                self.swiss = SwissTournament(
+                    sorted(team_name for team_name, _ in self.teams),
+                    self.layouts,
+                    settings["games_per_team"],
+                )
+
+    def _load_duration_model(self):
+        """
+        Loads the durations of past games from the stats db, importing first the stats json of runs not in it yet.
+        """
+        stats_db = StatsDB(self.stats_db_file)
+        try:
+            stats_db.import_stats_archive(self.stats_archive_dir)
+            no_games = self.duration_model.load_games(stats_db.game_durations(self.max_steps))
+            logging.info(
+                "Duration model loaded with {} past games from {}".format(no_games, self.stats_db_file)
+            )
+        finally:
+            stats_db.close()
 
     def _close(self):
         pass
@@ -87,11 +270,12 @@ class ContestRunner:
         (red_team_name, red_team_agent_factory) = red_team
         (blue_team_name, blue_team_agent_factory) = blue_team
         # TODO: make the -c an option at the meta level to "Catch exceptions and enforce time limits"
-        command = 'python3 capture.py -c -r "{red_team_agent_factory}" -b "{blue_team_agent_factory}" -l {layout} -i {steps} -q --record --recordLog --delay 0.0 --fixRandomSeed'.format(
+        command = 'python3 {game_runner} -c -r "{red_team_agent_factory}" -b "{blue_team_agent_factory}" -l {layout} -i {steps} -q --record --recordLog --delay 0.0 --fixRandomSeed'.format(
             red_team_agent_factory=red_team_agent_factory,
             blue_team_agent_factory=blue_team_agent_factory,
             layout=layout,
             steps=self.max_steps,
+            game_runner=GAME_RUNNER_FILE,
         )
         return command
 
@@ -126,8 +310,10 @@ class ContestRunner:
                 except:
                     output = ""
 
-        if exit_code == 0:
-            pass
+        if exit_code in DEADLINE_EXIT_CODES:
+            self._record_deadline_kill(red_team_name, blue_team_name, layout, output)
+        if exit_code in (0, SKIPPED_EXIT_CODE) + DEADLINE_EXIT_CODES:
+            pass  # a game forfeited is reported once per broken team (see _team_loaded), a game killed when analysed
             # print(
             #     ' Successful: Log in {output_file}.'.format(output_file=os.path.join(self.tmp_logs_dir, log_file_name)))
         else:
@@ -137,9 +323,16 @@ class ContestRunner:
                 )
             )
 
-        score, winner, loser, bug, totaltime = self._parse_result(
-            output, red_team_name, blue_team_name, layout
+        # the outcome recorded by the game runner, if any; otherwise scraped from the log
+        outcome = self._read_result_record(
+            os.path.join(self.tmp_logs_dir, self._result_file_name(red_team_name, blue_team_name, layout)),
+            red_team_name,
+            blue_team_name,
+            layout,
         )
+        if outcome is None:
+            outcome = self._parse_result(output, red_team_name, blue_team_name, layout)
+        score, winner, loser, bug, totaltime = outcome
 
         if winner is None:
             self.ladder[red_team_name].append(score)
@@ -170,6 +363,146 @@ class ContestRunner:
                 (red_team_name, blue_team_name, layout, ERROR_SCORE, winner, totaltime)
             )
 
+        self._archive_game(red_team_name, blue_team_name, layout, log_file_name, replay_file_name)
+
+    def _archive_game(self, red_team_name, blue_team_name, layout, log_file_name, replay_file_name):
+        """
+        Appends the log, result record and replay of a game just analysed to the logs and replays archives.
+        """
+        if self.logs_archive is None:
+            return
+        result_file_name = self._result_file_name(red_team_name, blue_team_name, layout)
+        for file_name in [log_file_name, result_file_name]:
+            if os.path.isfile(os.path.join(self.tmp_logs_dir, file_name)):
+                self.logs_archive.add(os.path.join(self.tmp_logs_dir, file_name))
+        if os.path.isfile(os.path.join(self.tmp_replays_dir, replay_file_name)):
+            self.replays_archive.add(os.path.join(self.tmp_replays_dir, replay_file_name))
+
+    def _team_loaded(self, team_name, loaded, layout):
+        """
+        Records whether a team loaded fine in a game: a team that failed to load in BROKEN_TEAM_FAILED_LAYOUTS different
+        layouts and never loaded fine is broken (the failure does not depend on the host or the game), so its remaining
+        games need not be played.
+        """
+        if loaded:
+            self.loaded_teams.add(team_name)
+            self.broken_teams.discard(team_name)
+            self.failed_layouts.pop(team_name, None)
+        elif team_name not in self.loaded_teams and team_name not in self.broken_teams:
+            self.failed_layouts.setdefault(team_name, set()).add(layout)
+            if len(self.failed_layouts[team_name]) >= BROKEN_TEAM_FAILED_LAYOUTS:
+                logging.warning(
+                    "Team {} failed to load in layouts {}: its remaining games will be forfeited".format(
+                        team_name, ", ".join(sorted(self.failed_layouts[team_name]))
+                    )
+                )
+                self.broken_teams.add(team_name)
+
+    def game_decided(self, job):
+        """
+        Returns True if the game of a job needs not be played as its outcome is already decided: one of the teams is
+        broken (see _team_loaded), so it loses (both do, if both are broken). Used to skip jobs in the cluster.
+        """
+        red_team, blue_team, _ = job.data
+        with self.analysis_lock:
+            return bool(job.command) and (
+                red_team[0] in self.broken_teams or blue_team[0] in self.broken_teams
+            )
+
+    def _forfeit_game(self, red_team_name, blue_team_name, layout):
+        """
+        Writes the log and result record of a game skipped because of broken teams, as if they failed to load in it,
+        so it is analysed (and restored on resume) like any other game.
+        """
+        teams = {"red": red_team_name, "blue": blue_team_name}
+        failed_to_load = [team for team, team_name in teams.items() if team_name in self.broken_teams]
+        with open(
+            os.path.join(self.tmp_logs_dir, "{}_vs_{}_{}.log".format(red_team_name, blue_team_name, layout)), "w"
+        ) as f:
+            for team in failed_to_load:
+                print("Game not played: {} team {} failed to load in a previous game.".format(
+                    team.capitalize(), teams[team]), file=f)
+        with open(
+            os.path.join(self.tmp_logs_dir, self._result_file_name(red_team_name, blue_team_name, layout)), "w"
+        ) as f:
+            json.dump(
+                {"score": None, "winner": None, "failed_to_load": failed_to_load, "crashed": None,
+                 "timeout": False, "steps": None, "secs": 0},
+                f,
+            )
+
+    def _record_deadline_kill(self, red_team_name, blue_team_name, layout, output):
+        """
+        Writes the result record of a game killed at its deadline, unless the game runner left a complete one (i.e.,
+        it stopped on SIGTERM): a timeout of the team moving then, if the runner got to log it, or of no team.
+        """
+        result_file_path = os.path.join(
+            self.tmp_logs_dir, self._result_file_name(red_team_name, blue_team_name, layout)
+        )
+        try:
+            with open(result_file_path, "r") as f:
+                json.load(f)
+            return
+        except (IOError, ValueError):
+            pass  # e.g., empty, as the game runner was killed for good (SIGKILL) before it could write it
+        moving = DEADLINE_MOVING_REGEX.search(output or "")
+        with open(result_file_path, "w") as f:
+            json.dump(
+                {"score": None, "winner": None, "failed_to_load": [],
+                 "crashed": moving.group(1) if moving else None, "timeout": True, "steps": None,
+                 "secs": self.game_timeout},
+                f,
+            )
+
+    @staticmethod
+    def _result_file_name(red_team_name, blue_team_name, layout):
+        return "{red_team_name}_vs_{blue_team_name}_{layout}.result.json".format(
+            layout=layout, red_team_name=red_team_name, blue_team_name=blue_team_name
+        )
+
+    def _read_result_record(self, result_file_path, red_team_name, blue_team_name, layout):
+        """
+        Reads the outcome of a match from the record left by the game runner (see run_game.py).
+        :return: a tuple as per _parse_result, or None if there is no (complete) record of the match outcome
+        """
+        try:
+            with open(result_file_path, "r") as f:
+                record = json.load(f)
+        except (IOError, ValueError):
+            return None  # e.g., empty (the game runner could not even start) or an old game with no record
+
+        teams = {"red": red_team_name, "blue": blue_team_name}
+        for team in teams:
+            if failed_on_start(record, team):
+                self._team_loaded(teams[team], False, layout)
+            elif record["steps"]:
+                self._team_loaded(teams[team], True, layout)
+        failed = record["failed_to_load"] or ([record["crashed"]] if record["crashed"] else [])
+        if failed:
+            for team in failed:
+                self.errors[teams[team]] += 1
+            if len(failed) == 2:  # both teams failed to load, no one wins
+                return ERROR_SCORE, None, None, True, 0
+            loser = teams[failed[0]]
+            winner = blue_team_name if loser == red_team_name else red_team_name
+            return 1, winner, loser, True, round(record["secs"] or 0)
+        if record["timeout"]:
+            # killed at the deadline while no agent was moving: an error of both teams, as when both fail to load (see
+            #   game_team_stats, used by the live and incremental standings)
+            logging.error("Game {} vs {} killed at the deadline while no agent was moving".format(
+                red_team_name, blue_team_name))
+            for team_name in teams.values():
+                self.errors[team_name] += 1
+            return ERROR_SCORE, None, None, True, round(record["secs"] or 0)
+        if record["score"] is None:
+            return None  # the game ended in some other error: leave it to the log
+        if record["winner"] is None:
+            winner, loser = None, None
+        else:
+            winner = teams[record["winner"]]
+            loser = blue_team_name if winner == red_team_name else red_team_name
+        return record["score"], winner, loser, False, round(record["secs"])
+
     def _parse_result(self, output, red_team_name, blue_team_name, layout):
         """
         Parses the result log of a match.
@@ -192,6 +525,10 @@ class ContestRunner:
 
         if output.find("Traceback") != -1 or output.find("agent crashed") != -1:
             bug = True
+            if output.find("Red team failed to load!") != -1:
+                self._team_loaded(red_team_name, False, layout)
+            if output.find("Blue team failed to load!") != -1:
+                self._team_loaded(blue_team_name, False, layout)
             # if both teams fail to load, no one wins
             if (
                 output.find("Red team failed to load!") != -1
@@ -327,17 +664,18 @@ class ContestRunner:
             "organizer": self.organizer,
             "timestamp_id": self.contest_timestamp_id,
         }
-
-        # Process replays: compress and upload
-        replays_archive_name = "replays_%s.tar" % self.contest_timestamp_id
-        replays_archive_name += ".gz" if self.compress_logs else ""
-        replays_archive_full_path = os.path.join(
-            self.replays_archive_dir, replays_archive_name
-        )
-        with tarfile.open(
-            replays_archive_full_path, "w:gz" if self.compress_logs else "w"
-        ) as tar:
-            tar.add(self.tmp_replays_dir, arcname="/")
+        if self.makespan is not None:
+            data_stats["makespan"] = self.makespan
+        if self.result_cache is not None:
+            data_stats["cached_games"] = self.no_cached_games
+        data_stats["platform_hash"] = self.platform_hash
+        data_stats["team_hashes"] = self.team_hashes
+        if self.previous_stats is not None:
+            data_stats["incremental_from"] = self.incremental_from
+            data_stats["previous_games"] = self.no_previous_games
+
+        # Process replays: close the archive (appended to as games finished) and upload
+        replays_archive_full_path = self._close_archive(self.replays_archive, self.tmp_replays_dir)
         if self.upload_replays:
             try:
                 replays_file_url = self.upload_file(
@@ -353,14 +691,8 @@ class ContestRunner:
                 replays_archive_full_path, self.www_dir
             )  # stats-archive/stats_xxx.json
 
-        # Process replays: compress and upload
-        logs_archive_name = "logs_%s.tar" % self.contest_timestamp_id
-        logs_archive_name += ".gz" if self.compress_logs else ""
-        logs_archive_full_path = os.path.join(self.logs_archive_dir, logs_archive_name)
-        with tarfile.open(
-            logs_archive_full_path, "w:gz" if self.compress_logs else "w"
-        ) as tar:
-            tar.add(self.tmp_logs_dir, arcname="/")
+        # Process logs: close the archive (appended to as games finished) and upload
+        logs_archive_full_path = self._close_archive(self.logs_archive, self.tmp_logs_dir)
         if self.upload_logs:
             try:
                 logs_file_url = self.upload_file(
@@ -380,9 +712,24 @@ class ContestRunner:
         stats_file_rel_path = os.path.relpath(stats_file_full_path, self.www_dir)
         with open(stats_file_full_path, "w") as f:
             json.dump(data_stats, f)
+        self._store_stats_db(data_stats)
 
         return stats_file_rel_path, replays_file_url, logs_file_url
 
+    def _store_stats_db(self, data_stats):
+        """
+        Adds the stats of the run to the stats db; the run is in its stats json anyway, so a failure is only logged.
+        """
+        try:
+            stats_db = StatsDB(self.stats_db_file)
+            try:
+                stats_db.add_run(data_stats)
+            finally:
+                stats_db.close()
+        except sqlite3.Error as e:
+            logging.warning("Could not store run {} in stats db {}: {}".format(
+                self.contest_timestamp_id, self.stats_db_file, str(e)))
+
     # prepare local direcotires to store replays, logs, etc.
     def prepare_dirs(self):
         if not os.path.exists(self.stats_archive_dir):
@@ -392,32 +739,76 @@ class ContestRunner:
         if not os.path.exists(self.logs_archive_dir):
             os.makedirs(self.logs_archive_dir)
 
+    def _open_archives(self):
+        """
+        Opens the replays and logs archives of the run, to append each game as it finishes; only when the run is resumed
+        from the journal are the games archived before it was interrupted kept.
+        """
+        self.replays_archive = GameArchive(
+            os.path.join(
+                self.replays_archive_dir,
+                archive_file_name("replays", self.contest_timestamp_id, self.archive_codec),
+            ),
+            self.archive_codec,
+            resume=self.resuming,
+        )
+        self.logs_archive = GameArchive(
+            os.path.join(
+                self.logs_archive_dir,
+                archive_file_name("logs", self.contest_timestamp_id, self.archive_codec),
+            ),
+            self.archive_codec,
+            resume=self.resuming,
+        )
+
+    @staticmethod
+    def _close_archive(archive, tmp_dir):
+        """
+        Appends the files in tmp_dir not archived yet (e.g., games kept from a resume folder), and closes the archive.
+        :return: the path of the archive
+        """
+        for file_name in sorted(os.listdir(tmp_dir)):
+            archive.add(os.path.join(tmp_dir, file_name))
+        archive.close()
+        return archive.path
+
     # Generates a job to play read_team vs blue_team in layout
     def _generate_job(self, red_team, blue_team, layout):
         """
         Generates a job command to play red_team against blue team in a layout. This job is run inside the sandbox
-        folder for this particular game (e.g., /tmp/cluster_instance_xxxx)
+        folder for this particular game (e.g., /tmp/cluster_instance_xxxx), where its output files are also collected
 
         :param red_team: the path to the red team (e.g., teams/targethdplus/myTeam.py)
         :param blue_team: the path to the blue team (e.g., teams/targethdplus/myTeam.py)
         :param layout: the name of the layout (e.g., RANDOM2737)
         :return: a Job() object with the job to be scheduled in cluster
         """
-        red_team_name, _ = red_team
-        blue_team_name, _ = blue_team
+        red_team_name, red_team_agent_factory = red_team
+        blue_team_name, blue_team_agent_factory = blue_team
 
         game_command = self._generate_command(red_team, blue_team, layout)
 
-        deflate_command = "mkdir -p {contest_dir} ; unzip -o {zip_file} -d {contest_dir} ; chmod +x -R *".format(
-            zip_file=os.path.join("/tmp", CORE_CONTEST_TEAM_ZIP_FILE),
-            contest_dir=self.tmp_dir,
+        # the core package is unpacked once per host; the game just gets a copy of the platform and of its two teams in
+        #   its own job directory, where it runs and leaves replay-0 and log-0
+        deflate_command = sandbox_command(
+            self.core_package_dir, [red_team_agent_factory, blue_team_agent_factory]
         )
 
-        command = "{deflate_command} ; cd {contest_dir} ; {game_command} ; touch {replay_filename}".format(
+        # the deadline is not part of _generate_command, so changing it does not invalidate the result cache. A game
+        #   killed at the deadline exits with the code of timeout (DEADLINE_EXIT_CODES), and its files are fetched as
+        #   they are (see _record_deadline_kill); otherwise, the job fails (and is retried) if the game left no complete
+        #   result record
+        command = (
+            "{deflate_command} ; {game_command} ; status=$? ; touch {replay_filename} {log_filename} {result_filename} ; "
+            "case $status in {deadline_exit_codes}) exit $status ;; esac ; "
+            "python3 -m json.tool {result_filename} > /dev/null"
+        ).format(
             deflate_command=deflate_command,
-            contest_dir=self.tmp_dir,
-            game_command=game_command,
+            game_command=with_timeout(game_command, self.game_timeout),
             replay_filename="replay-0",
+            log_filename="log-0",
+            result_filename=GAME_RESULT_FILE,
+            deadline_exit_codes="|".join(str(exit_code) for exit_code in DEADLINE_EXIT_CODES),
         )
 
         replay_file_name = "{red_team_name}_vs_{blue_team_name}_{layout}.replay".format(
@@ -436,17 +827,23 @@ class ContestRunner:
 
         ret_file_replay = TransferableFile(
             local_path=os.path.join(self.tmp_replays_dir, replay_file_name),
-            remote_path=os.path.join(self.tmp_dir, "replay-0"),
+            remote_path="replay-0",  # relative to the job directory
         )
         ret_file_log = TransferableFile(
             local_path=os.path.join(self.tmp_logs_dir, log_file_name),
-            remote_path=os.path.join(self.tmp_dir, "log-0"),
+            remote_path="log-0",
+        )
+        ret_file_result = TransferableFile(
+            local_path=os.path.join(
+                self.tmp_logs_dir, self._result_file_name(red_team_name, blue_team_name, layout)
+            ),
+            remote_path=GAME_RESULT_FILE,
         )
 
         return Job(
             command=command,
             required_files=[],
-            return_files=[ret_file_replay, ret_file_log],
+            return_files=[ret_file_replay, ret_file_log, ret_file_result],
             data=(red_team, blue_team, layout),
             id="{}-vs-{}-in-{}".format(red_team_name, blue_team_name, layout),
         )
@@ -467,7 +864,8 @@ class ContestRunner:
         )
 
     def _analyse_all_outputs(self, results):
-        logging.info(f"About to analyze game result outputs. Number of result output to analyze: {len(results)}")
+        if len(results) > 1:
+            logging.info(f"About to analyze game result outputs. Number of result output to analyze: {len(results)}")
         for result in results:
             (
                 (red_team, blue_team, layout),
@@ -476,7 +874,7 @@ class ContestRunner:
                 error,
                 total_secs_taken,
             ) = result
-            if not exit_code == 0:
+            if exit_code not in (0, SKIPPED_EXIT_CODE) + DEADLINE_EXIT_CODES:
                 print(
                     "Game {} VS {} in {} exited with code {} and here is the output:".format(
                         red_team[0], blue_team[0], layout, exit_code, output
@@ -487,7 +885,52 @@ class ContestRunner:
             )
 
     def run_contest_remotely(self, hosts, resume_folder=None, first=True):
+        jobs = self.prepare_jobs(hosts, resume_folder)
+        predicted_makespan = 0
+        time_start = datetime.datetime.now()
+        while jobs:  # a Swiss tournament has several rounds of jobs, a round robin just one
+            predicted_makespan += predict_makespan(
+                [self.predict_job_secs(job) for job in jobs],
+                sum(host.no_cpu for host in hosts),
+            )
+
+            # create cluster with hosts and jobs and run it by starting it; each game is analysed as soon as it finishes
+            if first:
+                cm = ClusterManager(
+                    hosts, jobs, [self.core_req_file], batch=self.batch_mode, journal=self.journal
+                )
+            else:
+                # subsequent contests (and rounds) don't need to transfer the files again
+                cm = ClusterManager(
+                    hosts, jobs, None, batch=self.batch_mode, journal=self.journal
+                )
+            # sys.exit(0)
+            cm.start(callback=self.game_finished, skip=self.game_decided)
+            first = False
+            jobs = self.next_jobs()
+        actual_makespan = (datetime.datetime.now() - time_start).total_seconds()
+        self.finish_jobs(predicted_makespan, actual_makespan)
+
+    def prepare_jobs(self, hosts, resume_folder=None):
+        """
+        Prepares the run of the contest: the games that need not be played (restored from the journal, reused from the
+        cache) are analysed straight away, and the jobs of the rest are returned, longest predicted first, to be run
+        in a cluster whose callback is game_finished (see run_contest_remotely, or MultiContest.run_contests to run
+        them together with the jobs of other contests).
+        :return: the jobs of the games to be played
+        """
         self.prepare_dirs()
+        self._open_archives()
+
+        #  This is the core package to be transferable to each host (and unpacked there once)
+        self.core_req_file = TransferableFile(
+            local_path=os.path.join(TMP_DIR, CORE_CONTEST_TEAM_ZIP_FILE),
+            remote_path=os.path.join("/tmp", CORE_CONTEST_TEAM_ZIP_FILE),
+        )
+        self.core_package_dir = core_package_dir(self.core_req_file.local_path)
+        self.platform_hash, self.team_hashes = code_hashes(
+            package_manifest(self.core_req_file.local_path)
+        )
 
         if resume_folder is not None:
             contest_folder = os.path.split(self.tmp_dir)[1]
@@ -501,31 +944,348 @@ class ContestRunner:
             jobs = self.resume_contest_jobs()
         else:
             jobs = self.run_contest_jobs()
+            if self.incremental_from is not None:
+                jobs = self._keep_previous_games(jobs)
+        jobs = self._jobs_to_play(jobs)
+        if not jobs:
+            jobs = self.next_jobs()
+        if self.live_interval:
+            self._start_live(self.swiss.no_games() if self.swiss else len(self.games) + len(jobs))
+        return jobs
 
-        #  This is the core package to be transferable to each host
-        core_req_file = TransferableFile(
-            local_path=os.path.join(TMP_DIR, CORE_CONTEST_TEAM_ZIP_FILE),
-            remote_path=os.path.join("/tmp", CORE_CONTEST_TEAM_ZIP_FILE),
-        )
+    def next_jobs(self):
+        """
+        Returns the jobs of the next round of a Swiss tournament, paired on the games played so far (so it has to be
+        called once the jobs of the previous round were run); [] if there is no round left, or no Swiss tournament.
+        A round with nothing to play (all its games restored from the journal, reused from the cache or forfeited) does
+        not end the tournament: the next round is paired straight away.
+        """
+        if self.swiss is None:
+            return []
+        while True:
+            round_jobs = self._swiss_round_jobs()
+            if not round_jobs:
+                return []
+            jobs = self._jobs_to_play(round_jobs)
+            if jobs:
+                return jobs
+
+    def _swiss_round_jobs(self):
+        teams = dict(self.teams)
+        return [
+            self._generate_job((red_team_name, teams[red_team_name]), (blue_team_name, teams[blue_team_name]), layout)
+            for red_team_name, blue_team_name, layout in self.swiss.next_round(self.games)
+        ]
+
+    def _jobs_to_play(self, jobs):
+        """
+        Takes the games of the jobs that need not be played (restored from the journal, reused from the cache) and
+        analyses them straight away; the ones played are analysed as they finish.
+        :return: the jobs of the games to be played, longest predicted first
+        """
+        jobs, journaled_results = self._restore_journaled_games(jobs)
+        jobs, forfeited_results = self._forfeit_decided_games(jobs)
+        jobs, cached_results = self._reuse_cached_games(jobs)
+        with self.analysis_lock:
+            no_games = len(self.games)
+            self._analyse_all_outputs(journaled_results + forfeited_results + cached_results)
+            self._update_live(self.games[no_games:])
+
+        # Longest predicted games first (LPT scheduling), so no long game is left to the end to run on its own
+        return sorted(jobs, key=self.predict_job_secs, reverse=True)
+
+    def finish_jobs(self, predicted_makespan, actual_makespan):
+        """
+        Completes the stats of the contest once all its jobs were run (and analysed as they finished).
+        """
+        self._report_makespan(predicted_makespan, actual_makespan)
 
-        # create cluster with hosts and jobs and run it by starting it, and then analyze output results
-        # results will contain all outputs from every game played
-        if first:
-            cm = ClusterManager(hosts, jobs, [core_req_file])
+        print(
+            "========================= GAMES FINISHED - ALL OUTPUTS ANALYSED ========================= "
+        )
+        if self.previous_stats is None:
+            self._calculate_team_stats()
         else:
-            # subsequent contests don't need to transfer the files again
-            cm = ClusterManager(hosts, jobs, None)
-        # sys.exit(0)
-        results = cm.start()
+            self._merge_team_stats()
+        if self.live is not None:
+            self.live.finish(self.team_stats, len(self.games))
 
-        print(
-            "========================= GAMES FINISHED - NEXT ANALYSING OUTPUT OF GAMES ========================= "
+    def _load_previous_stats(self):
+        """
+        Loads the stats of the run to be continued in incremental mode; it can only be continued if it was played with
+        the same platform and options.
+        :return: the stats data of the previous run, or None if it cannot be continued
+        """
+        stats_file_full_path = os.path.join(
+            self.stats_archive_dir, "stats_%s.json" % self.incremental_from
+        )
+        try:
+            with open(stats_file_full_path, "r") as f:
+                data = json.load(f)
+        except (IOError, ValueError) as e:
+            logging.warning(
+                "Could not load stats of run {} to continue: {}".format(self.incremental_from, str(e))
+            )
+            return None
+        if "team_hashes" not in data:
+            logging.warning(
+                "Run {} has no team code hashes, cannot tell the teams updated".format(self.incremental_from)
+            )
+            return None
+        if data.get("platform_hash") != self.platform_hash or data["max_steps"] != self.max_steps:
+            logging.warning(
+                "Run {} was played with another platform or max steps".format(self.incremental_from)
+            )
+            return None
+        return data
+
+    def _keep_previous_games(self, jobs):
+        """
+        Incremental mode: keeps the games of the previous run between teams that were not updated since then (in
+        self.games), and leaves only the jobs of the rest to be played. Games of teams no longer in the contest are
+        dropped. If the previous run cannot be continued, all games are played.
+        :return: the jobs still to be played
+        """
+        self.previous_stats = self._load_previous_stats()
+        if self.previous_stats is None:
+            logging.warning("All games will be played")
+            return jobs
+
+        previous_team_hashes = self.previous_stats["team_hashes"]
+        unchanged_teams = {
+            team_name
+            for team_name, _ in self.teams
+            if team_name in previous_team_hashes
+            and previous_team_hashes[team_name] == self.team_hashes.get(team_name)
+        }
+        previous_games = {
+            _game_id(game[0], game[1], game[2]): tuple(game) for game in self.previous_stats["games"]
+        }
+
+        jobs_to_play = []
+        for job in jobs:
+            (red_team_name, _), (blue_team_name, _), layout = job.data
+            game_id = _game_id(red_team_name, blue_team_name, layout)
+            if (
+                red_team_name in unchanged_teams
+                and blue_team_name in unchanged_teams
+                and game_id in previous_games
+            ):
+                self.games.append(previous_games[game_id])
+            else:
+                jobs_to_play.append(job)
+        self.no_previous_games = len(self.games)
+        logging.info(
+            "Incremental run from {}: {} games kept, {} games to be played ({} teams new or updated)".format(
+                self.incremental_from,
+                len(self.games),
+                len(jobs_to_play),
+                len(self.teams) - len(unchanged_teams),
+            )
+        )
+        return jobs_to_play
+
+    def _merge_team_stats(self):
+        """
+        Incremental mode: updates the standings of the previous run with the games dropped (those not kept) and the
+        games just played, instead of recomputing them from all the games.
+        """
+        team_stats = {
+            team_name: list(self.previous_stats["team_stats"].get(team_name, [0] * 6))
+            for team_name, _ in self.teams
+        }
+        kept_games = {
+            _game_id(red_team_name, blue_team_name, layout)
+            for (red_team_name, blue_team_name, layout, _, _, _) in self.games[: self.no_previous_games]
+        }
+        dropped_games = [
+            game
+            for game in self.previous_stats["games"]
+            if _game_id(game[0], game[1], game[2]) not in kept_games
+        ]
+        for games, sign in [(dropped_games, -1), (self.games[self.no_previous_games :], 1)]:
+            for game in games:
+                for team_name, deltas in game_team_stats(*game).items():
+                    if team_name in team_stats:
+                        team_stats[team_name] = [
+                            stat + sign * delta for stat, delta in zip(team_stats[team_name], deltas)
+                        ]
+        self.team_stats = team_stats
+
+    def _restore_journaled_games(self, jobs):
+        """
+        Takes the games done before the run was interrupted, as recorded in the journal (their logs and replays are
+        still in the tmp dirs), instead of playing them again.
+        :return: the jobs still to be played, and the results of the games restored
+        """
+        if self.journal is None:
+            return jobs, []
+        jobs_to_play = []
+        journaled_results = []
+        for job in jobs:
+            record = self.journal.job_done(job) if job.command else None
+            if record is not None and os.path.isfile(job.return_files[1].local_path):
+                journaled_results.append((job.data, record["exit_code"], "", "", record["secs"]))
+            else:
+                jobs_to_play.append(job)
+        if journaled_results:
+            logging.info(
+                "Journal: {} games restored, {} games to be played".format(
+                    len(journaled_results), len(jobs_to_play)
+                )
+            )
+        return jobs_to_play, journaled_results
+
+    def _forfeit_decided_games(self, jobs):
+        """
+        Forfeits the games of the teams known to be broken (e.g., found in the pre-flight), instead of playing them.
+        :return: the jobs still to be played, and the results of the games forfeited
+        """
+        jobs_to_play = []
+        forfeited_results = []
+        for job in jobs:
+            if self.game_decided(job):
+                red_team, blue_team, layout = job.data
+                self._forfeit_game(red_team[0], blue_team[0], layout)
+                forfeited_results.append((job.data, SKIPPED_EXIT_CODE, "", "", 0))
+            else:
+                jobs_to_play.append(job)
+        if forfeited_results:
+            logging.info(
+                "Broken teams {}: {} games forfeited".format(sorted(self.broken_teams), len(forfeited_results))
+            )
+        return jobs_to_play, forfeited_results
+
+    def _cache_key(self, job):
+        """
+        Returns the result cache key of the game of a job, or None if the game cannot be cached.
+        """
+        red_team, blue_team, layout = job.data
+        red_team_hash = self.team_hashes.get(red_team[0])
+        blue_team_hash = self.team_hashes.get(blue_team[0])
+        if not job.command or red_team_hash is None or blue_team_hash is None:
+            return None
+        return game_key(
+            red_team_hash,
+            blue_team_hash,
+            self.platform_hash,
+            self._generate_command(red_team, blue_team, layout),
+        )
+
+    def _reuse_cached_games(self, jobs):
+        """
+        Takes the log, replay and result record of each game in the result cache, instead of playing it again.
+        :return: the jobs still to be played, and the results of the games taken from the cache
+        """
+        if self.result_cache is None:
+            return jobs, []
+        jobs_to_play = []
+        cached_results = []
+        for job in jobs:
+            key = self._cache_key(job)
+            if key is not None and self.result_cache.get(
+                key, *(return_file.local_path for return_file in self._game_files(job))
+            ):
+                cached_results.append((job.data, 0, "", "", 0))
+            else:
+                jobs_to_play.append(job)
+        self.no_cached_games = len(cached_results)
+        logging.info(
+            "Result cache: {} games reused, {} games to be played".format(
+                len(cached_results), len(jobs_to_play)
+            )
+        )
+        return jobs_to_play, cached_results
+
+    def game_finished(self, job, result):
+        """
+        Called by the cluster (from its worker threads) as soon as each game finishes for good: the game is analysed
+        and cached while the rest are still being played.
+        """
+        with self.analysis_lock:
+            if result[1] == SKIPPED_EXIT_CODE:
+                red_team, blue_team, layout = job.data
+                self._forfeit_game(red_team[0], blue_team[0], layout)
+            self._analyse_all_outputs([result])
+            self._update_live(self.games[-1:])
+        self._cache_game(job, result)
+
+    def _update_live(self, games):
+        """
+        Adds the games just analysed to the live leaderboard, if any.
+        """
+        if self.live is None:
+            return
+        for game in games:
+            _add_team_stats(self.live_team_stats, game)
+        self.live.update(self.live_team_stats, len(self.games))
+
+    def _start_live(self, no_games):
+        """
+        Starts the live leaderboard of the run with the games analysed so far (e.g., kept from a previous run).
+        """
+        self.live_team_stats = {team_name: [0] * 6 for team_name, _ in self.teams}
+        for game in self.games:
+            _add_team_stats(self.live_team_stats, game)
+        self.live = LiveLeaderboard(
+            self.www_dir, self.organizer, self.contest_timestamp_id, no_games, self.live_interval
+        )
+        self.live.start(self.live_team_stats, len(self.games))
+
+    def _cache_game(self, job, result):
+        """
+        Stores in the result cache a game just played.
+        """
+        if self.result_cache is None:
+            return
+        key = self._cache_key(job)
+        if key is None or result[1] != 0:
+            return  # the game could not be played, so there is no result to cache
+        ret_file_log, ret_file_replay, ret_file_result = self._game_files(job)
+        try:
+            with open(ret_file_result.local_path, "r") as f:
+                record = json.load(f)
+        except (IOError, ValueError):
+            return  # no record of the outcome (e.g., the game was killed for good)
+        if record["timeout"] or record["score"] is None:
+            return  # the outcome depends on the host (e.g., its load), or there was no game: play it again next time
+        if os.path.isfile(ret_file_log.local_path):
+            self.result_cache.put(
+                key, ret_file_log.local_path, ret_file_replay.local_path, ret_file_result.local_path
+            )
+
+    @staticmethod
+    def _game_files(job):
+        """
+        :return: the return files of the log, replay and result record of the game of a job
+        """
+        ret_file_replay, ret_file_log, ret_file_result = job.return_files[:3]
+        return ret_file_log, ret_file_replay, ret_file_result
+
+    def predict_job_secs(self, job):
+        """
+        Predicts the seconds a job will take using the duration model (restored games, with no command, take none).
+        """
+        if not job.command:
+            return 0
+        (red_team_name, _), (blue_team_name, _), layout = job.data
+        return self.duration_model.predict(red_team_name, blue_team_name, layout)
+
+    def _report_makespan(self, predicted_secs, actual_secs):
+        self.makespan = {"predicted": round(predicted_secs), "actual": round(actual_secs)}
+        logging.info(
+            "MAKESPAN REPORT for {}: predicted {} / actual {} ({:+.0%} error)".format(
+                self.contest_timestamp_id,
+                str(datetime.timedelta(seconds=round(predicted_secs))),
+                str(datetime.timedelta(seconds=round(actual_secs))),
+                (predicted_secs - actual_secs) / actual_secs if actual_secs > 0 else 0,
+            )
         )
-        self._analyse_all_outputs(results)
-        self._calculate_team_stats()
 
     def run_contest_jobs(self):
         jobs = []
+        if self.swiss is not None:
+            return self._swiss_round_jobs()  # the first round; the rest are paired as they are played (see next_jobs)
         if self.staff_teams_vs_others_only:
             for red_team in self.teams:
                 for blue_team in self.staff_teams:
@@ -534,7 +1294,9 @@ class ContestRunner:
                     for layout in self.layouts:
                         jobs.append(self._generate_job(red_team, blue_team, layout))
         else:
-            for red_team, blue_team in combinations(self.teams, r=2):
+            # teams paired in name order, so two teams play with the same colours in every run (the teams of a split
+            #   come shuffled), and their games can be reused from the result cache
+            for red_team, blue_team in combinations(sorted(self.teams), r=2):
                 for layout in self.layouts:
                     jobs.append(self._generate_job(red_team, blue_team, layout))
         return jobs
@@ -567,7 +1329,7 @@ class ContestRunner:
                             jobs.append(self._generate_job(red_team, blue_team, layout))
 
         else:
-            for red_team, blue_team in combinations(self.teams, r=2):
+            for red_team, blue_team in combinations(sorted(self.teams), r=2):
                 for layout in self.layouts:
                     red_team_name, _ = red_team
                     blue_team_name, _ = blue_team
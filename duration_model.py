@@ -0,0 +1,104 @@
+"""
+DurationModel predicts how long a game will take from the game durations recorded in past runs (see
+StatsDB.game_durations), so that the longest games can be dispatched first (LPT scheduling) and the makespan of a run
+estimated in advance.
+
+A game duration is predicted as the average duration of games in its layout (for the same max_steps), scaled by how
+slow the two teams are on average relative to all games. Unseen layouts/teams fall back to the overall averages.
+"""
+__author__ = "Sebastian Sardina, Marco Tamassia, and Nir Lipovetzky"
+__copyright__ = "Copyright 2017-2020"
+__license__ = "GPLv3"
+
+import heapq
+
+RANDOM_LAYOUT_KEY = "RANDOM"  # key grouping all random layouts (used when a random seed was never played)
+
+
+class DurationModel:
+    def __init__(self, max_steps, default_secs=60):
+        """
+        :param max_steps: only games played with this number of steps are used to predict
+        :param default_secs: predicted duration when there is no history at all
+        """
+        self.max_steps = max_steps
+        self.default_secs = default_secs
+
+        # key -> [total seconds, no. of games]
+        self.layout_secs = {}
+        self.team_secs = {}
+        self.all_secs = [0, 0]
+
+    def load_games(self, games):
+        """
+        Loads the given game durations, as (red team, blue team, layout, secs), e.g., from StatsDB.game_durations.
+        :return: number of games loaded
+        """
+        no_games = 0
+        for (red_team_name, blue_team_name, layout, totaltime) in games:
+            no_games += self.add_game(red_team_name, blue_team_name, layout, totaltime)
+        return no_games
+
+    def add_game(self, red_team_name, blue_team_name, layout, secs):
+        """
+        Records the duration of a game. Games with no time recorded are ignored.
+        :return: 1 if the game was recorded, 0 otherwise
+        """
+        if not secs or secs <= 0:
+            return 0
+        for key in {layout, _layout_group(layout)}:
+            _accumulate(self.layout_secs, key, secs)
+        _accumulate(self.team_secs, red_team_name, secs)
+        _accumulate(self.team_secs, blue_team_name, secs)
+        self.all_secs[0] += secs
+        self.all_secs[1] += 1
+        return 1
+
+    def predict(self, red_team_name, blue_team_name, layout):
+        """
+        :return: the predicted number of seconds for red_team_name vs blue_team_name in layout
+        """
+        if self.all_secs[1] == 0:
+            return self.default_secs
+        avg_secs = self.all_secs[0] / self.all_secs[1]
+
+        base_secs = _average(self.layout_secs, layout)
+        if base_secs is None:
+            base_secs = _average(self.layout_secs, _layout_group(layout), avg_secs)
+
+        # a team factor > 1 means the team plays slower games than average
+        red_factor = _average(self.team_secs, red_team_name, avg_secs) / avg_secs
+        blue_factor = _average(self.team_secs, blue_team_name, avg_secs) / avg_secs
+
+        return base_secs * (red_factor + blue_factor) / 2
+
+
+def predict_makespan(durations, no_workers):
+    """
+    Simulates greedy dispatch of the durations, in the order given, on no_workers workers (each job goes to the first
+    free worker, as ClusterManager does).
+    :return: the seconds until the last job finishes
+    """
+    if no_workers <= 0 or not durations:
+        return 0
+    workers_free_at = [0] * min(no_workers, len(durations))
+    for secs in durations:
+        heapq.heappush(workers_free_at, heapq.heappop(workers_free_at) + secs)
+    return max(workers_free_at)
+
+
+def _layout_group(layout):
+    return RANDOM_LAYOUT_KEY if layout.startswith(RANDOM_LAYOUT_KEY) else layout
+
+
+def _accumulate(table, key, secs):
+    entry = table.setdefault(key, [0, 0])
+    entry[0] += secs
+    entry[1] += 1
+
+
+def _average(table, key, default=None):
+    if key not in table:
+        return default
+    total_secs, no_games = table[key]
+    return total_secs / no_games
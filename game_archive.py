@@ -0,0 +1,248 @@
+"""
+GameArchive is an append-only tar archive of game files (replays or logs), written as each game finishes instead of
+packing a whole directory at the end of the run.
+
+Each file is appended as its own tar member, and when compressed (gzip or zstd), each member is compressed as its own
+stream; concatenated streams are still a valid .tar.gz / .tar.zst file, so the archive can be downloaded and extracted
+as usual (e.g., tar xzf replays_xxx.tar.gz). An index file next to the archive (<archive>.index, one JSON line per
+member with its name and the offset and length of its stream) allows extracting a single file by reading and
+decompressing only its own stream (see read_member).
+
+Run as a script, it serves the www dir over HTTP, including each single file of the archives by its index (the results
+pages link each game to <archive url>/<file name>, e.g., replays-archive/replays_xxx.tar.gz/a_vs_b_layout.replay):
+
+    python3 game_archive.py --www-dir www --port 8000
+
+zstd needs the zstandard package (pip install zstandard); it is much faster than gzip and compresses with several
+threads.
+"""
+__author__ = "Sebastian Sardina, Marco Tamassia, and Nir Lipovetzky"
+__copyright__ = "Copyright 2017-2020"
+__license__ = "GPLv3"
+
+import io
+import os
+import json
+import gzip
+import tarfile
+import logging
+import argparse
+import threading
+import socketserver
+import urllib.parse
+import http.server
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# codec -> archive file extension
+ARCHIVE_CODECS = {"none": ".tar", "gzip": ".tar.gz", "zstd": ".tar.zst"}
+INDEX_SUFFIX = ".index"
+
+
+def _compress(codec, data):
+    if codec == "gzip":
+        return gzip.compress(data)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(threads=-1).compress(data)
+    return data
+
+
+def _decompress(codec, data):
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def archive_codec(path):
+    """
+    :return: the codec of an archive, from its file name extension
+    """
+    for codec, extension in ARCHIVE_CODECS.items():
+        if path.endswith(extension):
+            return codec
+    raise ValueError("Unknown archive type %s" % path)
+
+
+def archive_file_name(prefix, run_id, codec):
+    """
+    :return: the name of the archive of a run, e.g., replays_<run_id>.tar.gz
+    """
+    return "%s_%s%s" % (prefix, run_id, ARCHIVE_CODECS[codec])
+
+
+class GameArchive:
+    def __init__(self, path, codec="none", resume=False):
+        """
+        Opens the archive to append files to it. If resume is True (the run is being resumed) and the archive exists,
+        the files already indexed are kept, and anything written after them (a member half written, or the end of the
+        archive) dropped; otherwise the archive is started anew, replacing any archive left by another run in the path.
+        """
+        if codec not in ARCHIVE_CODECS:
+            raise ValueError("Unknown archive codec %s" % codec)
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("zstd archives need the zstandard package (pip install zstandard)")
+        self.path = path
+        self.codec = codec
+        self.index = read_index(path) if resume else []
+        if not resume and os.path.exists(path):
+            logging.warning("Archive %s exists (another run with the same id?): replacing it" % path)
+        self.members = {entry["name"] for entry in self.index}
+
+        end = self.index[-1]["offset"] + self.index[-1]["length"] if self.index else 0
+        self.file = open(path, "r+b" if os.path.exists(path) else "wb")
+        self.file.truncate(end)
+        self.file.seek(end)
+        self.index_file = open(path + INDEX_SUFFIX, "w")
+        for entry in self.index:
+            self.index_file.write(json.dumps(entry) + "\n")
+        self.index_file.flush()
+
+    def add(self, file_path, arcname=None):
+        """
+        Appends a file to the archive (only once per name), and indexes it.
+        """
+        arcname = arcname or os.path.basename(file_path)
+        if arcname in self.members:
+            return
+        with open(file_path, "rb") as f:
+            data = f.read()
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mtime = os.path.getmtime(file_path)
+        info.mode = 0o644
+        member = info.tobuf(format=tarfile.GNU_FORMAT) + data
+        member += tarfile.NUL * (-len(member) % tarfile.BLOCKSIZE)
+
+        stream = _compress(self.codec, member)
+        entry = {"name": arcname, "offset": self.file.tell(), "length": len(stream), "size": len(data)}
+        self.file.write(stream)
+        self.file.flush()
+        self.index_file.write(json.dumps(entry) + "\n")
+        self.index_file.flush()
+        self.index.append(entry)
+        self.members.add(arcname)
+
+    def close(self):
+        """
+        Ends the archive (the end of archive blocks go in their own stream, not indexed, so more files can still be
+        appended by opening it again).
+        """
+        self.file.write(_compress(self.codec, tarfile.NUL * (2 * tarfile.BLOCKSIZE)))
+        self.file.close()
+        self.index_file.close()
+        logging.info("Archive %s closed with %d files" % (self.path, len(self.index)))
+
+
+def read_index(path):
+    """
+    :return: the index entries of an archive, in order ([] if it has no index)
+    """
+    index = []
+    if not os.path.exists(path + INDEX_SUFFIX):
+        return index
+    with open(path + INDEX_SUFFIX, "r") as f:
+        for line in f:
+            try:
+                index.append(json.loads(line))
+            except ValueError:
+                break  # an entry half written: the member it indexes is dropped
+    return index
+
+
+def read_member(path, entry):
+    """
+    Reads one file from an archive, given its index entry, without reading the rest of the archive.
+    :return: the content of the file
+    """
+    with open(path, "rb") as f:
+        f.seek(entry["offset"])
+        member = _decompress(archive_codec(path), f.read(entry["length"]))
+    with tarfile.open(fileobj=io.BytesIO(member), mode="r:") as tar:
+        return tar.extractfile(tar.next()).read()
+
+
+def archive_members(path):
+    """
+    :return: the names of the files in an archive, or None if it has no index (e.g., it was packed by an old version)
+    """
+    if not os.path.exists(path + INDEX_SUFFIX):
+        return None
+    return {entry["name"] for entry in read_index(path)}
+
+
+class ArchiveRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves the files in the current directory, and each file of an archive as <archive path>/<file name>, read from the
+    archive through its index.
+    """
+
+    indexes = {}  # archive path -> (mtime of its index, {file name: index entry}), shared by all requests
+    indexes_lock = threading.Lock()
+
+    def do_GET(self):
+        member = self._archive_member()
+        if member is None:
+            return super().do_GET()
+        archive_path, name = member
+        entry = self._index(archive_path).get(name)
+        if entry is None:
+            self.send_error(404, "File not found in archive")
+            return
+        data = read_member(archive_path, entry)
+        self.send_response(200)
+        content_type = "text/plain; charset=utf-8" if name.endswith(".log") else "application/octet-stream"
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Content-Disposition", 'inline; filename="%s"' % name)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _archive_member(self):
+        """
+        :return: the local path of the archive and the name of the file requested, or None if the request is not for a
+        file in an archive
+        """
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        for extension in ARCHIVE_CODECS.values():
+            position = path.find(extension + "/")
+            if position >= 0:
+                archive_path = self.translate_path(path[: position + len(extension)])
+                if os.path.isfile(archive_path):
+                    return archive_path, path[position + len(extension) + 1:]
+        return None
+
+    def _index(self, archive_path):
+        if not os.path.exists(archive_path + INDEX_SUFFIX):
+            return {}
+        mtime = os.path.getmtime(archive_path + INDEX_SUFFIX)
+        with self.indexes_lock:
+            if archive_path not in self.indexes or self.indexes[archive_path][0] != mtime:
+                self.indexes[archive_path] = (
+                    mtime, {entry["name"]: entry for entry in read_index(archive_path)}
+                )
+            return self.indexes[archive_path][1]
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s %(levelname)-8s %(message)s", level=logging.INFO,
+                        datefmt="%a, %d %b %Y %H:%M:%S")
+    parser = argparse.ArgumentParser(
+        description="Serves the www dir of the contest, including each replay and log of the archives by its index."
+    )
+    parser.add_argument("--www-dir", default="www", help="www directory to serve (default: www).")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen to (default: 8000).")
+    args = parser.parse_args()
+
+    os.chdir(args.www_dir)
+    server = ThreadingHTTPServer(("", args.port), ArchiveRequestHandler)
+    logging.info("Serving %s at http://localhost:%d/" % (args.www_dir, args.port))
+    server.serve_forever()
@@ -0,0 +1,173 @@
+"""
+JobJournal is an append-only journal of a run (a multi-contest), with one JSON record per line, flushed and fsynced as
+it is written, so it survives a crash of the coordinator at any point:
+
+    {"event": "run", "timestamp_id": ..., "settings": {...}}            the settings of the run (layouts, team splits)
+    {"event": "job", "contest": ..., "job": ..., "status": "started", "attempt": 1}
+    {"event": "job", "contest": ..., "job": ..., "status": "done"|"failed", "attempt": 1, "exit_code": ..., "secs": ...}
+    {"event": "contest_done", "contest": ...}                           the stats of the contest were stored
+    {"event": "run_done"}
+
+A run whose journal has no run_done record is unfinished: it is resumed automatically with the same settings, and only
+the jobs not done are played again. A journal with a run_done record is never appended to.
+"""
+__author__ = "Sebastian Sardina, Marco Tamassia, and Nir Lipovetzky"
+__copyright__ = "Copyright 2017-2020"
+__license__ = "GPLv3"
+
+import os
+import re
+import json
+import random
+import logging
+import datetime
+import threading
+
+JOURNAL_FILE_PATTERN = re.compile(r"^journal_([-+0-9T:.a-z]+)\.jsonl$")
+
+
+class JobJournal:
+    def __init__(self, journal_dir, timestamp_id=None, journal_id=None):
+        """
+        :param timestamp_id: the timestamp id of a new run
+        :param journal_id: the id of the journal of an existing run to be opened (journal_<journal_id>.jsonl); a new
+        journal gets a unique one, as runs started in the same minute share their timestamp id: the timestamp id plus
+        the seconds and a random suffix
+        """
+        if journal_id is None:
+            journal_id = "{}-{}-{}".format(
+                timestamp_id,
+                datetime.datetime.now().strftime("%S"),
+                "".join(random.choice("0123456789abcdef") for _ in range(8)),
+            )
+        self.timestamp_id = timestamp_id  # of an existing run, read from its journal
+        self.path = os.path.join(journal_dir, "journal_%s.jsonl" % journal_id)
+        self.lock = threading.Lock()
+
+        # state of the run as recorded so far (if the journal exists already, i.e., the run is being resumed)
+        self.settings = None
+        self.jobs_done = {}  # (contest id, job id) -> "done" record of the job
+        self.contests_done = set()
+        self.finished = False
+
+        if not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+        self.resumed = os.path.exists(self.path)
+        if self.resumed:
+            self._load()
+        if self.finished:
+            self.file = None  # the run is over: its journal can be read, but not appended to
+            return
+        self.file = open(self.path, "a")
+        if self.file.tell() > 0 and not self._ends_with_newline():
+            self.file.write("\n")  # so the next record does not follow a half written one
+
+    @staticmethod
+    def find_unfinished(journal_dir):
+        """
+        :return: the journal of the last run in journal_dir if it did not finish, None otherwise
+        """
+        if not os.path.isdir(journal_dir):
+            return None
+        # the last run is the one whose journal was written last (runs of the same minute have random ids)
+        journal_ids = sorted(
+            (match.group(1) for match in map(JOURNAL_FILE_PATTERN.match, os.listdir(journal_dir)) if match),
+            key=lambda journal_id: os.path.getmtime(os.path.join(journal_dir, "journal_%s.jsonl" % journal_id)),
+        )
+        if not journal_ids:
+            return None
+        journal = JobJournal(journal_dir, journal_id=journal_ids[-1])
+        if journal.finished or journal.settings is None:
+            journal.close()
+            return None
+        return journal
+
+    def _load(self):
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a record half written when the coordinator crashed: it can only be the last one
+                    logging.warning("Ignoring incomplete record in journal {}".format(self.path))
+                    continue
+                event = record["event"]
+                if event == "run":
+                    self.timestamp_id = record["timestamp_id"]
+                    self.settings = record["settings"]
+                elif event == "job" and record["status"] == "done":
+                    self.jobs_done[(record["contest"], record["job"])] = record
+                elif event == "contest_done":
+                    self.contests_done.add(record["contest"])
+                elif event == "run_done":
+                    self.finished = True
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _write(self, record):
+        if self.file is None:
+            raise ValueError("Journal {} is of a finished run: it cannot be appended to".format(self.path))
+        with self.lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def start_run(self, settings):
+        self.settings = settings
+        self._write({"event": "run", "timestamp_id": self.timestamp_id, "settings": settings})
+
+    def record_job(self, contest_id, job, attempt, status, result=None):
+        record = {
+            "event": "job",
+            "contest": contest_id,
+            "job": job.id,
+            "status": status,
+            "attempt": attempt,
+        }
+        if result is not None:
+            _, exit_code, _, _, secs = result
+            record["exit_code"] = exit_code
+            record["secs"] = secs
+        self._write(record)
+
+    def contest_done(self, contest_id):
+        self.contests_done.add(contest_id)
+        self._write({"event": "contest_done", "contest": contest_id})
+
+    def run_done(self):
+        self._write({"event": "run_done"})
+        self.finished = True
+
+    def for_contest(self, contest_id):
+        return ContestJournal(self, contest_id)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class ContestJournal:
+    """
+    The view of a JobJournal for one contest, as used by ClusterManager to record each attempt of the contest jobs.
+    """
+
+    def __init__(self, journal, contest_id):
+        self.journal = journal
+        self.contest_id = contest_id
+
+    def job_started(self, job, attempt):
+        self.journal.record_job(self.contest_id, job, attempt, "started")
+
+    def job_finished(self, job, attempt, result):
+        # exit code -1 means the job could not be run (see cluster_manager.run_job)
+        status = "failed" if result[1] == -1 else "done"
+        self.journal.record_job(self.contest_id, job, attempt, status, result)
+
+    def job_done(self, job):
+        """
+        :return: the "done" record of the job if it was done in a previous attempt of the run, None otherwise
+        """
+        return self.journal.jobs_done.get((self.contest_id, job.id))
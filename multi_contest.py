@@ -11,7 +11,10 @@ import logging
 from string import ascii_lowercase
 
 from config import *
-from contest_runner import ContestRunner
+from contest_runner import ContestRunner, failed_on_start, game_timeout, sandbox_command, with_timeout
+from cluster_manager import ClusterManager, Job, TransferableFile, core_package_dir
+from duration_model import predict_makespan
+from job_journal import JobJournal
 
 
 def list_partition(list_in, n):
@@ -26,7 +29,11 @@ def get_agent_factory(team_name):
 
 
 class MultiContest:
-    def __init__(self, settings):
+    def __init__(self, settings, journal=None):
+        """
+        :param journal: the JobJournal of an unfinished run to be resumed (with its settings), if any; otherwise a new
+        journal is started in settings["journal_dir"]
+        """
         self.layouts = set()
         self.split = settings["split"]
         self.settings = settings
@@ -56,20 +63,26 @@ class MultiContest:
         # Report layouts to be played, fixed and random (with seeds)
         self.log_layouts()
 
-        # clear out old contest subdirectories
+        # clear out old contest subdirectories (unless resuming, as they have the games played so far)
         for contest_folder in os.listdir(TMP_DIR):
             contest_path = os.path.join(TMP_DIR, contest_folder)
             if (
-                os.path.isdir(contest_path)
+                journal is None
+                and os.path.isdir(contest_path)
                 and contest_folder.startswith("contest-")
                 and contest_folder != "contest-run"
             ):
                 shutil.rmtree(contest_path)
 
         # unique id for this execution of the contest; used to label logs
-        self.contest_timestamp_id = (
-            datetime.datetime.now().astimezone(TIMEZONE).strftime("%Y-%m-%d-%H-%M")
-        )
+        if journal is None:
+            self.contest_timestamp_id = (
+                datetime.datetime.now().astimezone(TIMEZONE).strftime("%Y-%m-%d-%H-%M")
+            )
+            self.journal = JobJournal(settings["journal_dir"], timestamp_id=self.contest_timestamp_id)
+        else:
+            self.contest_timestamp_id = journal.timestamp_id
+            self.journal = journal
 
         # Setup all of the TEAMS
         teams_dir = os.path.join(self.tmp_contest_dir, TEAMS_SUBDIR)
@@ -141,6 +154,9 @@ class MultiContest:
             json.dump(
                 self.settings, f, sort_keys=True, indent=4, separators=(",", ": ")
             )
+        # and journal it, so the run can be resumed with the same layouts and teams if interrupted
+        if not self.journal.resumed:
+            self.journal.start_run(self.settings)
 
         self.settings["layouts"] = self.layouts
         self.settings["staff_teams"] = [
@@ -154,10 +170,137 @@ class MultiContest:
             settings["contest_timestamp_id"] = (
                 self.contest_timestamp_id + "-" + ascii_lowercase[i]
             )
-            contests.append(ContestRunner(settings))
+            if self.settings.get("incremental_from"):
+                # each split continues the same split of the previous run
+                settings["incremental_from"] = (
+                    self.settings["incremental_from"] + "-" + ascii_lowercase[i]
+                )
+            contests.append(ContestRunner(settings, self.journal))
 
         return contests
 
+    def preflight(self, hosts):
+        """
+        Plays each team once against PREFLIGHT_OPPONENT in a tiny layout for a few steps, all in parallel in the
+        cluster, to find the teams that cannot even load (e.g., an import error in their agent factory) before any game
+        is scheduled: all the games of such a team are forfeited instead of played (see ContestRunner). These teams are kept in settings["preflight_failed_teams"], so they are
+        journaled with the run.
+        :return: the names of the teams that failed the pre-flight
+        """
+        core_req_file = TransferableFile(
+            local_path=os.path.join(TMP_DIR, CORE_CONTEST_TEAM_ZIP_FILE),
+            remote_path=os.path.join("/tmp", CORE_CONTEST_TEAM_ZIP_FILE),
+        )
+        preflight_dir = os.path.join(TMP_DIR, TMP_PREFLIGHT_DIR)
+        if os.path.exists(preflight_dir):
+            shutil.rmtree(preflight_dir)
+        os.makedirs(preflight_dir)
+
+        command = (
+            "{sandbox_command} ; "
+            + with_timeout(
+                'python3 {game_runner} -c -r "{agent_factory}" -b {opponent} -l {layout} -i {steps} -q --delay 0.0 '
+                "--fixRandomSeed",
+                self.settings.get("game_timeout") or game_timeout(PREFLIGHT_STEPS),
+            )
+            + " ; touch {result_file}"
+        )
+        jobs = [
+            Job(
+                command=command.format(
+                    sandbox_command=sandbox_command(
+                        core_package_dir(core_req_file.local_path), [get_agent_factory(team)]
+                    ),
+                    agent_factory=get_agent_factory(team),
+                    game_runner=GAME_RUNNER_FILE,
+                    opponent=PREFLIGHT_OPPONENT,
+                    layout=PREFLIGHT_LAYOUT,
+                    steps=PREFLIGHT_STEPS,
+                    result_file=GAME_RESULT_FILE,
+                ),
+                required_files=[],
+                return_files=[
+                    TransferableFile(
+                        local_path=os.path.join(preflight_dir, team + ".result.json"),
+                        remote_path=GAME_RESULT_FILE,
+                    )
+                ],
+                id="preflight-" + team,
+                data=team,
+            )
+            for team in self.teams + self.staff_teams
+        ]
+        logging.info("PRE-FLIGHT of {} teams vs {}".format(len(jobs), PREFLIGHT_OPPONENT))
+        cm = ClusterManager(hosts, jobs, [core_req_file], batch=self.settings.get("batch_mode", False))
+
+        failed_teams = []
+        for team, exit_code, _, _, _ in cm.start():
+            try:
+                with open(os.path.join(preflight_dir, team + ".result.json"), "r") as f:
+                    record = json.load(f)
+            except (IOError, ValueError):
+                # the game could not even be run (exit code -1), or its runner failed: not the fault of the team
+                logging.warning("Pre-flight of team {} gave no result (exit code {})".format(team, exit_code))
+                continue
+            if failed_on_start(record, "red"):
+                logging.warning(
+                    "Pre-flight of team {} FAILED: its games will be forfeited".format(team)
+                )
+                failed_teams.append(team)
+        self.settings["preflight_failed_teams"] = sorted(failed_teams)
+        return self.settings["preflight_failed_teams"]
+
+    def run_contests(self, contests, hosts, resume_folder=None):
+        """
+        Runs the games of all the contests (e.g., one per split) in a single cluster, longest predicted first, so no
+        contest is left to run its last games alone while the rest of the cluster sits idle. Each game is routed back
+        to its own contest (ContestRunner) to be analysed, and journaled, as it finishes. The rounds of Swiss
+        tournaments are played one after the other, each with the next round of every contest.
+        """
+        if not contests:
+            return
+        job_contests = {}  # id(job) -> contest of the job
+        jobs = []
+        for contest in contests:
+            for job in contest.prepare_jobs(hosts, resume_folder):
+                job_contests[id(job)] = contest
+                jobs.append(job)
+
+        def predict_job_secs(job):
+            return job_contests[id(job)].predict_job_secs(job)
+
+        predicted_makespan = 0
+        time_start = datetime.datetime.now()
+        first = True
+        while jobs:  # Swiss tournaments have several rounds of jobs, round robins just one
+            jobs = sorted(jobs, key=predict_job_secs, reverse=True)
+            predicted_makespan += predict_makespan(
+                [predict_job_secs(job) for job in jobs], sum(host.no_cpu for host in hosts)
+            )
+
+            # all the contests share the core package (platform + all the teams), so it is transferred once
+            cm = ClusterManager(
+                hosts,
+                jobs,
+                [contests[0].core_req_file] if first else None,
+                batch=self.settings.get("batch_mode", False),
+                journal=_ContestsJournal(job_contests),
+            )
+            cm.start(
+                callback=lambda job, result: job_contests[id(job)].game_finished(job, result),
+                skip=lambda job: job_contests[id(job)].game_decided(job),
+            )
+            first = False
+
+            jobs = []
+            for contest in contests:
+                for job in contest.next_jobs():
+                    job_contests[id(job)] = contest
+                    jobs.append(job)
+        actual_makespan = (datetime.datetime.now() - time_start).total_seconds()
+        for contest in contests:
+            contest.finish_jobs(predicted_makespan, actual_makespan)
+
     def split_teams(self):
         prior_split = self.settings.get("teams")
         if prior_split is not None:
@@ -200,6 +343,7 @@ class MultiContest:
         contest_zip_file.extractall(os.path.join(destination, "."))
         layouts_zip_file = zipfile.ZipFile(layouts_zip_file_path)
         layouts_zip_file.extractall(os.path.join(destination, "layouts"))
+        shutil.copy(os.path.join(DIR_SCRIPT, GAME_RUNNER_FILE), destination)
 
         # Pick no_fixed_layouts layouts from the given set in the layout zip file
         #   if layout seeds have been given use them
@@ -398,3 +542,23 @@ class MultiContest:
                     continue
                 team_names[student_id] = team_name
         return team_names
+
+
+class _ContestsJournal:
+    """
+    Journal of a cluster running the jobs of several contests: each job attempt is recorded in the journal of its own
+    contest (see job_journal.ContestJournal).
+    """
+
+    def __init__(self, job_contests):
+        self.job_contests = job_contests
+
+    def job_started(self, job, attempt):
+        journal = self.job_contests[id(job)].journal
+        if journal is not None:
+            journal.job_started(job, attempt)
+
+    def job_finished(self, job, attempt, result):
+        journal = self.job_contests[id(job)].journal
+        if journal is not None:
+            journal.job_finished(job, attempt, result)
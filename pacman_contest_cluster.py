@@ -27,6 +27,7 @@ import logging
 # from dataclasses import dataclass
 from cluster_manager import Host
 from multi_contest import MultiContest
+from job_journal import JobJournal
 from pacman_html_generator import HtmlGenerator
 from config import *
 import copy
@@ -77,9 +78,21 @@ def load_settings():
                         help="replays archive output directory.")
     parser.add_argument("--logs-archive-dir",
                         help="logs archive output directory.")
+    parser.add_argument("--stats-db",
+                        help=f"SQLite database where the stats of each run are also stored, for queries across runs "
+                             f"(default: {DEFAULT_STATS_DB_FILE} in the stats archive directory).")
     parser.add_argument("--compress-logs",
                         help="compress logs in a tar.gz file (otherwise, logs will be archived in a tar file).",
                         action="store_true")
+    parser.add_argument("--archive-codec",
+                        help="compression of the replays and logs archives, which are appended to as each game "
+                             "finishes: none (.tar), gzip (.tar.gz), or zstd (.tar.zst, needs the zstandard package) "
+                             "(default: gzip if --compress-logs is given, none otherwise).",
+                        choices=["none", "gzip", "zstd"])
+    parser.add_argument("--game-links",
+                        help="link each game in the results pages to its replay and log in the archives; these links "
+                             "are only served by game_archive.py, not by a static host of the www dir.",
+                        action="store_true")
     parser.add_argument("--workers-file",
                         help="json file with workers details.")
     parser.add_argument("--teams-root",
@@ -127,6 +140,37 @@ def load_settings():
     parser.add_argument("--upload-all",
                         help="uploads logs and replays into https://transfer.sh.",
                         action="store_true")
+    parser.add_argument("--batch-mode",
+                        help="run games in each host through one batch runner agent streaming results back, "
+                             "instead of one SSH command and SFTP transfer per game.",
+                        action="store_true")
+    parser.add_argument("--cache-dir",
+                        help="directory of the game result cache: games whose teams code, platform and options did not "
+                             "change since they were played (in any run) are not played again.")
+    parser.add_argument("--incremental-from",
+                        help="timestamp id of a previous run (e.g., 2020-05-01-10-30) to continue: its games between "
+                             "teams not updated since are kept, and only the games of new or updated teams are played.")
+    parser.add_argument("--journal-dir",
+                        help=f"directory of the journals of runs (default: {DEFAULT_JOURNAL_DIR}); an unfinished run "
+                             f"found there is resumed automatically, playing only the games not played yet.")
+    parser.add_argument("--live-interval",
+                        help="keep a live leaderboard (www/live_<run id>.html) of each contest while it runs, refreshed "
+                             "at most every given seconds.",
+                        type=int)
+    parser.add_argument("--games-per-team",
+                        help="play a Swiss tournament of (at most) this many games per team, one per round against a "
+                             "team close in the ranking, stopping early once the ranking is settled, instead of every "
+                             "pair of teams in every layout.",
+                        type=int)
+    parser.add_argument("--no-preflight",
+                        help=f"do not play each team first against {PREFLIGHT_OPPONENT} in a tiny layout to find the "
+                             f"teams that cannot even load (whose games are then forfeited instead of played).",
+                        action="store_true")
+    parser.add_argument("--game-timeout",
+                        help=f"wall-clock deadline of each game in seconds (default: {GAME_TIMEOUT_MARGIN_SECS} plus "
+                             f"{GAME_SECS_PER_STEP} per step); a game still running then is killed on the worker and "
+                             f"recorded as a timeout of the team moving.",
+                        type=int)
     parser.add_argument("--split",
                         help=f"split contest into n leagues (default: {DEFAULT_NO_SPLIT}).",
                         type=int)
@@ -155,6 +199,17 @@ def load_settings():
     settings_default["upload_replays"] = False
     settings_default["upload_logs"] = False
     settings_default["allow_non_registered_students"] = False
+    settings_default["batch_mode"] = False
+    settings_default["cache_dir"] = None
+    settings_default["incremental_from"] = None
+    settings_default["journal_dir"] = DEFAULT_JOURNAL_DIR
+    settings_default["live_interval"] = None
+    settings_default["archive_codec"] = None
+    settings_default["stats_db"] = None
+    settings_default["games_per_team"] = None
+    settings_default["no_preflight"] = False
+    settings_default["game_timeout"] = None
+    settings_default["game_links"] = False
 
     # Then set the settings from config file, if any provided
     settings_json = {}
@@ -243,11 +298,13 @@ if __name__ == "__main__":
     hosts = [
         Host(
             no_cpu=w["no_cpu"],
-            hostname=w["hostname"],
-            username=w["username"],
-            password=w["password"],
-            key_filename=w["private_key_file"],
-            key_password=w["private_key_password"],
+            hostname=w.get("hostname"),
+            username=w.get("username"),
+            password=w.get("password"),
+            key_filename=w.get("private_key_file"),
+            key_password=w.get("private_key_password"),
+            executor=w.get("executor", "ssh"),
+            image=w.get("image"),
         )
         for w in workers_details
     ]
@@ -256,19 +313,41 @@ if __name__ == "__main__":
     resume_contest_folder = settings["resume_contest_folder"]
     del settings["resume_contest_folder"]
 
+    # an unfinished run (e.g., the coordinator crashed) is resumed with its own settings, from its journal
+    journal = None
+    if resume_contest_folder is None:
+        journal = JobJournal.find_unfinished(settings["journal_dir"])
+        if journal is not None:
+            logging.info(
+                "Resuming unfinished run {} from journal {}".format(journal.timestamp_id, journal.path)
+            )
+            settings = {**settings, **journal.settings}
+
     logging.info("Will create contest runner with options: {}".format(settings))
 
-    multi_contest = MultiContest(settings)
-    first = True
+    multi_contest = MultiContest(settings, journal)
+    journal = multi_contest.journal
+    # teams that cannot load are found before scheduling any game (a resumed run has them in its settings already)
+    if not settings["no_preflight"] and not journal.resumed:
+        multi_contest.preflight(hosts)
+    runners = []
     for runner in multi_contest.create_contests():
-        runner.run_contest_remotely(hosts, resume_contest_folder, first)
-        first = False
-
+        if runner.contest_timestamp_id in journal.contests_done:
+            logging.info("Contest {} was completed already".format(runner.contest_timestamp_id))
+            continue
+        runners.append(runner)
+
+    # the games of all the contests (splits) are played together in one cluster, then each contest is stored
+    multi_contest.run_contests(runners, hosts, resume_contest_folder)
+    for runner in runners:
         stats_file_url, replays_file_url, logs_file_url = runner.store_results()
-        html_generator = HtmlGenerator(settings["www_dir"], settings["organizer"])
+        html_generator = HtmlGenerator(settings["www_dir"], settings["organizer"], settings["game_links"])
         html_generator.add_run(
             runner.contest_timestamp_id, stats_file_url, replays_file_url, logs_file_url
         )
         logging.info("Web pages generated. Now cleaning up and closing... Thank you!")
+        journal.contest_done(runner.contest_timestamp_id)
 
         runner.clean_up()
+    journal.run_done()
+    journal.close()
@@ -18,9 +18,15 @@ import shutil
 import zipfile
 import logging
 import re
+import time
+import hashlib
 import datetime
+import urllib.parse
 from pytz import timezone
 
+from config import ERROR_SCORE
+from game_archive import archive_members, INDEX_SUFFIX
+
 # logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG, datefmt='%a, %d %b %Y %H:%M:%S')
 logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO,
                     datefmt='%a, %d %b %Y %H:%M:%S')
@@ -28,6 +34,29 @@ logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logg
 DIR_SCRIPT = sys.path[0]
 FILE_FONTS = os.path.join(DIR_SCRIPT, "fonts.zip")
 FILE_CSS = os.path.join(DIR_SCRIPT, "style.css")
+# www/.build_manifest.json: hash of the inputs of each page generated (and of the assets copied), so that only the pages
+#   of new or changed runs are generated again
+BUILD_MANIFEST_FILE = '.build_manifest.json'
+
+
+def _file_hash(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# a change in this script changes the pages generated, so it is an input of all of them
+GENERATOR_HASH = _file_hash(os.path.abspath(__file__))
+
+def _existing_archive(tar_file_path):
+    """
+    Returns the path of the archive for the given .tar path with the extension it was written with (.tar, .tar.gz
+    or .tar.zst, see game_archive.py); .tar.gz if none is found.
+    """
+    for extension in ['', '.gz', '.zst']:
+        if os.path.exists(tar_file_path + extension):
+            return tar_file_path + extension
+    return tar_file_path + '.gz'
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Load settings either from config.json or from the command line
@@ -55,6 +84,11 @@ def load_settings():
         '--logs-archive-dir',
         help='logs directory (default <www-dir>/logs-archive)'
     )
+    parser.add_argument(
+        '--game-links',
+        help='link each game to its replay and log in the archives (only if www is served by game_archive.py)',
+        action='store_true'
+    )
     parser.add_argument(
         dest='www_dir', type=str,
         help='output directory'
@@ -104,6 +138,8 @@ def load_settings():
     else:
         settings['logs_archive_dir'] = os.path.join(settings['www_dir'], 'logs-archive')
 
+    settings['game_links'] = args.game_links
+
     logging.info('Script will run with this configuration: %s' % settings)
 
     return settings
@@ -112,16 +148,18 @@ def load_settings():
 # ----------------------------------------------------------------------------------------------------------------------
 
 class HtmlGenerator:
-    ERROR_SCORE = 9999
+    ERROR_SCORE = ERROR_SCORE
     RESULTS_DIR = 'results'
     TIMEZONE = timezone('Australia/Melbourne')
 
-    def __init__(self, www_dir, organizer):
+    def __init__(self, www_dir, organizer, game_links=False):
         """
         Initializes this generator.
 
         :param www_dir: the output path
         :param organizer: the name of the organizer of the tournament (e.g., XX University)
+        :param game_links: whether to link each game to its replay and log in the indexed archives; only the server in
+        game_archive.py serves those links, so they are broken when www_dir is hosted as static files
         """
 
         # path that contains files that make-up a html navigable web folder
@@ -130,6 +168,11 @@ class HtmlGenerator:
         # just used in html as a readable string
         self.organizer = organizer
 
+        self.game_links = game_links
+
+        # hash of the inputs of each run page generated, and of the assets copied (see BUILD_MANIFEST_FILE)
+        self.build_manifest = self._load_build_manifest()
+        self.assets_copied = False
 
     def _close(self):
         pass
@@ -142,11 +185,87 @@ class HtmlGenerator:
 
     def add_run(self, run_id, stats_url, replays_url, logs_url):
         """
-        (Re)Generates the HTML for the given run and updates the HTML index.
+        (Re)Generates the HTML for the given run, if new or changed, and updates the HTML index.
         :return:
         """
-        self._save_run_html(run_id, stats_url, replays_url, logs_url)
+        self.add_runs([(run_id, stats_url, replays_url, logs_url)])
+
+    def add_runs(self, runs):
+        """
+        Generates the HTML of each run (run_id, stats_url, replays_url, logs_url) given whose inputs changed since its
+        page was generated (or with no page yet), and then the HTML index, once.
+        :return: the number of run pages generated
+        """
+        no_generated = 0
+        for run_id, stats_url, replays_url, logs_url in runs:
+            # The URLs may be in byte format - convert them to strings if needed
+            stats_url, replays_url, logs_url = [
+                url.decode() if isinstance(url, bytes) else url for url in (stats_url, replays_url, logs_url)
+            ]
+            inputs_hash = self._run_inputs_hash(stats_url, replays_url, logs_url)
+            html_file_name = f'results_{run_id}.html'
+            if inputs_hash is not None and \
+                    self.build_manifest['runs'].get(run_id) == [inputs_hash, html_file_name] and \
+                    os.path.exists(os.path.join(self.www_dir, html_file_name)):
+                continue
+            self._save_run_html(run_id, stats_url, replays_url, logs_url)
+            self.build_manifest['runs'][run_id] = [inputs_hash, html_file_name]
+            no_generated += 1
         self._generate_main_html()
+        self._save_build_manifest()
+        logging.info(f'Generated the HTML of {no_generated} runs ({len(runs) - no_generated} unchanged)')
+        return no_generated
+
+    def _run_inputs_hash(self, stats_file_url, replays_file_url, logs_file_url):
+        """
+        Returns the hash of everything the HTML of a run is generated from, or None if unknown (stats not local).
+        """
+        if stats_file_url.startswith('http'):
+            return None
+        digest = hashlib.sha1(GENERATOR_HASH.encode())
+        digest.update(
+            json.dumps([self.organizer, stats_file_url, replays_file_url, logs_file_url, self.game_links]).encode()
+        )
+        with open(os.path.join(self.www_dir, stats_file_url), 'rb') as f:
+            digest.update(f.read())
+        # the game links depend on the files in the indexed archives
+        for archive_url in [replays_file_url, logs_file_url]:
+            if archive_url and not archive_url.startswith('http'):
+                index_path = os.path.join(self.www_dir, archive_url) + INDEX_SUFFIX
+                if os.path.exists(index_path):
+                    index_stat = os.stat(index_path)
+                    digest.update(f'{index_stat.st_size}:{index_stat.st_mtime_ns}'.encode())
+        return digest.hexdigest()
+
+    def _load_build_manifest(self):
+        try:
+            with open(os.path.join(self.www_dir, BUILD_MANIFEST_FILE), 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {'assets': {}, 'runs': {}}
+
+    def _save_build_manifest(self):
+        manifest_full_path = os.path.join(self.www_dir, BUILD_MANIFEST_FILE)
+        with open(manifest_full_path + '.tmp', 'w') as f:
+            json.dump(self.build_manifest, f)
+        os.replace(manifest_full_path + '.tmp', manifest_full_path)
+
+    def _copy_assets(self):
+        """
+        Copies the fonts and style sheet into the www dir, unless they were copied already and did not change.
+        """
+        if self.assets_copied:
+            return
+        assets_hash = {os.path.basename(f): _file_hash(f) for f in [FILE_FONTS, FILE_CSS]}
+        fonts_zip_file = zipfile.ZipFile(FILE_FONTS)
+        assets = fonts_zip_file.namelist() + [os.path.basename(FILE_CSS)]
+        if self.build_manifest['assets'] != assets_hash or \
+                not all(os.path.exists(os.path.join(self.www_dir, f)) for f in assets):
+            fonts_zip_file.extractall(self.www_dir)
+            shutil.copy(FILE_CSS, self.www_dir)
+            self.build_manifest['assets'] = assets_hash
+        fonts_zip_file.close()
+        self.assets_copied = True
 
     def _save_run_html(self, run_id, stats_file_url, replays_file_url, logs_file_url):
         """
@@ -158,20 +277,6 @@ class HtmlGenerator:
 
         No checks are done, so mind your parameters.
         """
-        # The URLs may be in byte format - convert them to strings if needed
-        try:
-            stats_file_url = stats_file_url.decode()
-        except AttributeError:
-            pass
-        try:
-            replays_file_url= replays_file_url.decode()
-        except AttributeError:
-            pass
-        try:
-            logs_file_url= logs_file_url.decode()
-        except AttributeError:
-            pass
-
         # Get the information in the stats file
         if stats_file_url.startswith('http'):  # http url
             import urllib.request as request
@@ -207,18 +312,28 @@ class HtmlGenerator:
 
         if not os.path.exists(self.www_dir):
             os.makedirs(self.www_dir)
-        contest_zip_file = zipfile.ZipFile(FILE_FONTS)
-        contest_zip_file.extractall(self.www_dir)
-        shutil.copy(FILE_CSS, self.www_dir)
+        self._copy_assets()
+
+        # files of each game in the (indexed) archives, linked from each game row
+        game_files = (self._archive_members(replays_file_url), self._archive_members(logs_file_url))
 
         run_html = self._generate_output(run_id, date_run, organizer, games, team_stats, random_layouts, fixed_layouts,
                                          max_steps,
-                                         stats_file_url, replays_file_url, logs_file_url)
+                                         stats_file_url, replays_file_url, logs_file_url, game_files)
 
         html_full_path = os.path.join(self.www_dir, f'results_{run_id}.html')
         with open(html_full_path, "w") as f:
             print(run_html, file=f)
 
+    def _archive_members(self, archive_url):
+        """
+        Returns the names of the files in a local archive with an index (see game_archive.py), None otherwise (or if
+        the games are not to be linked).
+        """
+        if not self.game_links or not archive_url or archive_url.startswith('http'):
+            return None
+        return archive_members(os.path.join(self.www_dir, archive_url))
+
     def _generate_main_html(self):
         """
         Generates the index HTML, containing links to the HTML files of all the runs.
@@ -232,7 +347,7 @@ class HtmlGenerator:
         for d in sorted(os.listdir(self.www_dir)):
             if d.endswith('fonts'):
                 continue
-            if not d.startswith('results'):
+            if not d.startswith('results') and not (d.startswith('live_') and d.endswith('.html')):
                 continue
             main_html += f"""<a href="{d}"> {d[:-5]}  </a> <br/>\n"""
         main_html += "\n\n<br/></body></html>"
@@ -240,10 +355,14 @@ class HtmlGenerator:
             print(main_html, file=f)
 
     def _generate_output(self, run_id, date_run, organizer, games, team_stats, random_layouts, fixed_layouts, max_steps,
-                         stats_url, replays_url, logs_url):
+                         stats_url, replays_url, logs_url, game_files=(None, None)):
         """
         Generates the HTML of the report of the run.
+
+        game_files has the names of the files in the replays and logs archives, if indexed: each game row then links to
+        its own replay and log, served one by one from the archive (see game_archive.py).
         """
+        replay_files, log_files = game_files
 
         if organizer is None:
             organizer = self.organizer
@@ -336,6 +455,8 @@ class HtmlGenerator:
             output += """<th>Time</th>"""
             output += """<th>Score</th>"""
             output += """<th>Winner</th>"""
+            if replay_files is not None or log_files is not None:
+                output += """<th>Files</th>"""
             output += """</tr>\n"""
             for (n1, n2, layout, score, winner, time_taken) in games:
                 output += """<tr>"""
@@ -377,6 +498,18 @@ class HtmlGenerator:
                     output += """<td>%d</td>""" % score
                     output += """<td><b>%s</b></td>""" % winner
 
+                # Replay and log of the game
+                if replay_files is not None or log_files is not None:
+                    game_file_name = "%s_vs_%s_%s" % (n1, n2, layout)
+                    links = []
+                    if replay_files is not None and game_file_name + ".replay" in replay_files:
+                        links.append("""<a href="%s/%s">replay</a>""" %
+                                     (replays_url, urllib.parse.quote(game_file_name + ".replay")))
+                    if log_files is not None and game_file_name + ".log" in log_files:
+                        links.append("""<a href="%s/%s">log</a>""" %
+                                     (logs_url, urllib.parse.quote(game_file_name + ".log")))
+                    output += """<td>%s</td>""" % " ".join(links)
+
                 output += """</tr>\n"""
 
         output += "\n\n</table></body></html>"
@@ -384,6 +517,116 @@ class HtmlGenerator:
         return output
 
 
+class LiveLeaderboard:
+    """
+    Live view of a run while its games are being played: a page (www/live_<run_id>.html), written once, that polls a
+    small JSON feed (www/live_<run_id>.json) with the standings, no. of games played and ETA.
+
+    The feed is rewritten at most once every interval seconds, and its size depends only on the number of teams (not
+    on the games played), so each refresh costs the same all along the run.
+    """
+
+    def __init__(self, www_dir, organizer, run_id, no_games, interval):
+        """
+        :param no_games: the total number of games of the run
+        :param interval: minimum seconds between two refreshes of the feed (also how often the page polls it)
+        """
+        self.www_dir = www_dir
+        self.organizer = organizer
+        self.run_id = run_id
+        self.no_games = no_games
+        self.interval = interval
+
+        self.feed_file_name = f'live_{run_id}.json'
+        self.time_start = None
+        self.no_games_start = 0  # games already played when the live view started (e.g., restored), not timed
+        self.time_last_update = 0
+
+    def start(self, team_stats, no_games_played):
+        """
+        Writes the live page, links it from the index, and writes the first feed.
+        """
+        if not os.path.exists(self.www_dir):
+            os.makedirs(self.www_dir)
+        shutil.copy(FILE_CSS, self.www_dir)
+        with open(os.path.join(self.www_dir, f'live_{self.run_id}.html'), "w") as f:
+            print(self._generate_page(), file=f)
+        HtmlGenerator(self.www_dir, self.organizer)._generate_main_html()
+
+        self.time_start = time.time()
+        self.no_games_start = no_games_played
+        self.update(team_stats, no_games_played, force=True)
+
+    def update(self, team_stats, no_games_played, force=False, finished=False):
+        """
+        Rewrites the feed with the current team stats ({team: [points, wins, draws, losses, errors, sum_score]}), unless
+        it was rewritten less than interval seconds ago (and force is not set).
+        """
+        now = time.time()
+        if not force and now - self.time_last_update < self.interval:
+            return
+        self.time_last_update = now
+
+        no_games_timed = no_games_played - self.no_games_start
+        if finished or no_games_timed <= 0:
+            eta_secs = 0 if finished else None
+        else:
+            eta_secs = round((now - self.time_start) / no_games_timed * (self.no_games - no_games_played))
+        standings = sorted(team_stats.items(), key=lambda v: (v[1][0], v[1][1], v[1][5]), reverse=True)
+        feed = {
+            'run_id': self.run_id,
+            'updated': datetime.datetime.now().astimezone(HtmlGenerator.TIMEZONE).strftime('%Y-%m-%d %H:%M:%S'),
+            'finished': finished,
+            'no_games': self.no_games,
+            'no_games_played': no_games_played,
+            'eta': None if eta_secs is None else str(datetime.timedelta(seconds=eta_secs)),
+            'standings': [[team] + list(stats) for team, stats in standings],
+        }
+
+        # written aside and then renamed, so the page never reads a half written feed
+        feed_full_path = os.path.join(self.www_dir, self.feed_file_name)
+        with open(feed_full_path + '.tmp', "w") as f:
+            json.dump(feed, f)
+        os.replace(feed_full_path + '.tmp', feed_full_path)
+
+    def finish(self, team_stats, no_games_played):
+        self.update(team_stats, no_games_played, force=True, finished=True)
+
+    def _generate_page(self):
+        output = """<html><head><title>Live results for the tournament round</title>\n"""
+        output += """<link rel="stylesheet" type="text/css" href="style.css"/></head>\n"""
+        output += """<body><h1>PACMAN Capture the Flag Tournament (LIVE)</h1>\n"""
+        output += """<h2>Tournament Organizer: %s </h2>\n""" % self.organizer
+        output += """<h2>Name of Tournament: %s </h2>\n""" % self.run_id
+        output += """<h3 id="progress">Waiting for results...</h3>\n"""
+        output += """<table border="1"><thead><tr><th>Position</th><th>Team</th><th>Points</th><th>Win</th>"""
+        output += """<th>Tie</th><th>Lost</th><th>TOTAL</th><th>FAILED</th><th>Score Balance</th></tr></thead>"""
+        output += """<tbody id="standings"></tbody></table>\n"""
+        output += """<script>
+function refresh() {
+    fetch("%s", {cache: "no-store"}).then(function (response) { return response.json(); }).then(function (feed) {
+        var progress = "Games played: " + feed.no_games_played + " of " + feed.no_games;
+        progress += feed.finished ? " (FINISHED)" : (feed.eta ? " / ETA: " + feed.eta : "");
+        document.getElementById("progress").textContent = progress + " / Updated: " + feed.updated;
+        // cells are set as text, as team names come from the submissions (they are not to be taken as HTML)
+        var standings = document.createElement("tbody");
+        standings.id = "standings";
+        feed.standings.forEach(function (s, i) {
+            var row = standings.insertRow();
+            [i + 1, s[0], s[1], s[2], s[3], s[4], s[2] + s[3] + s[4], s[5], s[6]].forEach(function (cell) {
+                row.insertCell().textContent = cell;
+            });
+        });
+        document.getElementById("standings").replaceWith(standings);
+        if (!feed.finished) setTimeout(refresh, %d);
+    }).catch(function () { setTimeout(refresh, %d); });
+}
+refresh();
+</script>\n""" % (self.feed_file_name, self.interval * 1000, self.interval * 1000)
+        output += """</body></html>"""
+        return output
+
+
 if __name__ == '__main__':
     settings = load_settings()
 
@@ -391,7 +634,7 @@ if __name__ == '__main__':
     replays_url = settings['replays_archive_dir']
     logs_url = settings['logs_archive_dir']
 
-    html_generator = HtmlGenerator(settings['www_dir'], settings['organizer'])
+    html_generator = HtmlGenerator(settings['www_dir'], settings['organizer'], settings['game_links'])
 
     if stats_dir is not None:
         pattern = re.compile(r'stats_([-+0-9T:.]+)\.json')
@@ -405,8 +648,9 @@ if __name__ == '__main__':
         replays_url = os.path.relpath(replays_url, www_dir) if replays_url else None
         logs_url = os.path.relpath(logs_url, www_dir) if logs_url else None
 
-        # Process each .json stat file - 1 per contest ran
-        for stats_file_name in all_files:
+        # Process each .json stat file - 1 per contest ran; only new or changed runs are generated again
+        runs = []
+        for stats_file_name in sorted(all_files):
             match = pattern.match(stats_file_name)
             if not match:
                 continue
@@ -420,7 +664,8 @@ if __name__ == '__main__':
             replays_file_full_path = os.path.join(replays_url, replays_file_name) if replays_url else None
             logs_file_full_path = os.path.join(logs_url, logs_file_name) if logs_url else None
 
-            replays_file_full_path += '.gz' if not os.path.exists(replays_file_full_path) else ''
-            logs_file_full_path += '.gz' if not os.path.exists(logs_file_full_path) else ''
+            replays_file_full_path = _existing_archive(replays_file_full_path)
+            logs_file_full_path = _existing_archive(logs_file_full_path)
 
-            html_generator.add_run(run_id, stats_file_full_path, replays_file_full_path, logs_file_full_path)
+            runs.append((run_id, stats_file_full_path, replays_file_full_path, logs_file_full_path))
+        html_generator.add_runs(runs)
@@ -0,0 +1,106 @@
+"""
+ResultCache stores the log, replay and result record (see run_game.py) of each game played, keyed on what determines the game outcome: the content of
+the code of both teams, the content of the platform (including layouts), and the game command (layout, seed, steps,
+options). Since games are played with --fixRandomSeed, a game whose key is in the cache needs not be played again.
+
+The content hashes are taken from the manifest of the core package zip (see cluster_manager.package_manifest), so
+nothing is hashed twice. The cache layout is:
+    <cache dir>/<key[:2]>/<key>/game.log
+    <cache dir>/<key[:2]>/<key>/game.replay
+    <cache dir>/<key[:2]>/<key>/game.result.json
+"""
+__author__ = "Sebastian Sardina, Marco Tamassia, and Nir Lipovetzky"
+__copyright__ = "Copyright 2017-2020"
+__license__ = "GPLv3"
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from config import TEAMS_SUBDIR
+
+CACHE_LOG_FILE = "game.log"
+CACHE_REPLAY_FILE = "game.replay"
+CACHE_RESULT_FILE = "game.result.json"
+
+
+def code_hashes(manifest):
+    """
+    Splits the manifest of the core package into one content hash per team (files under teams/<team>/) and one for
+    everything else (the platform).
+    :return: the platform hash and a dictionary with the hash of each team
+    """
+    platform_digest = hashlib.sha1()
+    team_digests = {}
+    teams_prefix = TEAMS_SUBDIR + "/"
+    for name, file_hash in sorted(manifest.items()):
+        if name.startswith(teams_prefix) and "/" in name[len(teams_prefix):]:
+            team_name, team_file = name[len(teams_prefix):].split("/", 1)
+            digest = team_digests.setdefault(team_name, hashlib.sha1())
+            name = team_file
+        else:
+            digest = platform_digest
+        digest.update(name.encode("utf-8"))
+        digest.update(file_hash.encode("ascii"))
+    return (
+        platform_digest.hexdigest(),
+        {team_name: digest.hexdigest() for team_name, digest in team_digests.items()},
+    )
+
+
+def game_key(red_team_hash, blue_team_hash, platform_hash, command):
+    """
+    :return: the cache key of a game of the given teams and platform (content hashes) run with the given command
+    """
+    return hashlib.sha1(
+        json.dumps([red_team_hash, blue_team_hash, platform_hash, command]).encode("utf-8")
+    ).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _game_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key, log_file_path, replay_file_path, result_file_path):
+        """
+        Copies the log, replay and result record of a cached game into the given paths.
+        :return: True if the game was in the cache, False otherwise (also for entries with no result record, stored by
+        older versions, as their outcome may not be reproducible)
+        """
+        game_dir = self._game_dir(key)
+        if not os.path.isfile(os.path.join(game_dir, CACHE_RESULT_FILE)):
+            return False
+        shutil.copy(os.path.join(game_dir, CACHE_LOG_FILE), log_file_path)
+        shutil.copy(os.path.join(game_dir, CACHE_RESULT_FILE), result_file_path)
+        if os.path.isfile(os.path.join(game_dir, CACHE_REPLAY_FILE)):
+            shutil.copy(os.path.join(game_dir, CACHE_REPLAY_FILE), replay_file_path)
+        return True
+
+    def put(self, key, log_file_path, replay_file_path, result_file_path):
+        """
+        Stores the log, replay (if any) and result record of a game played. The game entry is written in a temporary directory and then
+        renamed, so a half written entry is never used.
+        """
+        game_dir = self._game_dir(key)
+        if os.path.isfile(os.path.join(game_dir, CACHE_RESULT_FILE)):
+            return
+        shutil.rmtree(game_dir, ignore_errors=True)  # an entry with no result record, stored by an older version
+        os.makedirs(os.path.dirname(game_dir), exist_ok=True)
+        tmp_game_dir = tempfile.mkdtemp(prefix=key, dir=os.path.dirname(game_dir))
+        try:
+            shutil.copy(log_file_path, os.path.join(tmp_game_dir, CACHE_LOG_FILE))
+            if os.path.isfile(replay_file_path):
+                shutil.copy(replay_file_path, os.path.join(tmp_game_dir, CACHE_REPLAY_FILE))
+            shutil.copy(result_file_path, os.path.join(tmp_game_dir, CACHE_RESULT_FILE))
+            os.rename(tmp_game_dir, game_dir)
+        except OSError as e:
+            logging.warning("Could not store game {} in result cache: {}".format(key, str(e)))
+            shutil.rmtree(tmp_game_dir, ignore_errors=True)
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Runs a game exactly as capture.py does (same command line options), and also leaves a machine-readable record of its
+outcome in result-0.json, so the contest does not need to scrape the game log:
+
+    {"score": 7, "winner": "red"|"blue"|null, "failed_to_load": ["red"|"blue", ...], "crashed": "red"|"blue"|null,
+     "timeout": false, "steps": 1200, "secs": 63.2}
+
+score is the absolute final score; crashed is the team whose agent crashed or timed out (timeout tells which one), and
+failed_to_load lists the teams that could not be loaded (there is no game then). The record is written even if the
+game ends in an exception, with whatever was known by then.
+
+When the game runs past its deadline on the worker, it is sent SIGTERM (see contest_runner.with_timeout): the game is
+then stopped straight away, keeping its log so far, and recorded as a timeout of the team whose agent was moving (or of
+no team, if none was).
+
+This file is copied into the contest folder (next to capture.py) and shipped with it to the hosts.
+"""
+__author__ = "Sebastian Sardina, Marco Tamassia, and Nir Lipovetzky"
+__copyright__ = "Copyright 2017-2020"
+__license__ = "GPLv3"
+
+import os
+import sys
+import json
+import time
+import signal
+
+import capture
+
+RESULT_FILE = "result-0.json"
+TIMEOUT_EXIT_CODE = 124  # as the timeout command
+
+result = {
+    "score": None,
+    "winner": None,
+    "failed_to_load": [],
+    "crashed": None,
+    "timeout": False,
+    "steps": None,
+    "secs": None,
+}
+moving = {"team": None}  # the team whose agent code is running, if any
+
+
+def _team(is_red):
+    return "red" if is_red else "blue"
+
+
+def _record_load_failure(load_agents):
+    def loadAgents(isRed, factory, textgraphics, cmdLineArgs):
+        try:
+            agents = load_agents(isRed, factory, textgraphics, cmdLineArgs)
+        except Exception:
+            # e.g., createTeam() raised: the game is aborted straight away (the other team is not even loaded)
+            result["failed_to_load"].append(_team(isRed))
+            raise
+        if None in agents:
+            result["failed_to_load"].append(_team(isRed))
+        for agent in agents:
+            _track_moving(agent, _team(isRed))
+        return agents
+
+    return loadAgents
+
+
+def _track_moving(agent, team):
+    for method_name in ("registerInitialState", "getAction"):
+        method = getattr(agent, method_name, None)
+        if method is not None:
+            setattr(agent, method_name, _moving(team, method))
+
+
+def _moving(team, method):
+    def tracked(*args, **kwargs):
+        moving["team"] = team
+        try:
+            return method(*args, **kwargs)
+        finally:
+            moving["team"] = None
+
+    return tracked
+
+
+def _record_timeout(start_time):
+    def stop(signum, frame):
+        result["crashed"] = moving["team"]
+        result["timeout"] = True
+        result["secs"] = round(time.time() - start_time, 1)
+        try:
+            # stdout is the game log (--recordLog): keep what was logged so far
+            print("\nGame stopped at its deadline (%s)" % ("%s team moving" % moving["team"] if moving["team"] else
+                                                           "no agent moving"))
+            sys.stdout.flush()
+        finally:
+            save_result()
+            os._exit(TIMEOUT_EXIT_CODE)
+
+    return stop
+
+
+def _record_crash(agent_crash):
+    def agentCrash(self, game, agentIndex):
+        # even agents are red (see CaptureRules.agentCrash); timeouts are also reported as crashes
+        result["crashed"] = _team(agentIndex % 2 == 0)
+        result["timeout"] = game.agentTimeout
+        agent_crash(self, game, agentIndex)
+
+    return agentCrash
+
+
+def _record_game(game):
+    score = game.state.data.score
+    result["score"] = abs(score)
+    result["winner"] = None if score == 0 else _team(score > 0)
+    result["steps"] = len(game.moveHistory)
+
+
+def save_result():
+    with open(RESULT_FILE, "w") as f:
+        json.dump(result, f)
+
+
+if __name__ == "__main__":
+    capture.loadAgents = _record_load_failure(capture.loadAgents)
+    capture.CaptureRules.agentCrash = _record_crash(capture.CaptureRules.agentCrash)
+
+    start_time = time.time()
+    signal.signal(signal.SIGTERM, _record_timeout(start_time))
+    try:
+        options = capture.readCommand(sys.argv[1:])  # Get game components based on input
+        print(options)
+
+        games = capture.runGames(**options)
+
+        if games:
+            capture.save_score(games[0])
+            _record_game(games[0])
+        print("\nTotal Time Game: %s" % round(time.time() - start_time, 0))
+    finally:
+        result["secs"] = round(time.time() - start_time, 1)
+        save_result()
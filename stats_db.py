@@ -0,0 +1,311 @@
+"""
+StatsDB is an SQLite database with the stats of all runs, indexed so that cross-run queries (e.g., the win rate of a
+team per layout over the semester) do not need to parse every stats_*.json archive:
+
+    runs(id, timestamp_id, organizer, max_steps, extra)     extra: JSON of any other key of the run stats
+    teams(id, name)
+    layouts(id, name, random)
+    run_layouts(run, layout)
+    games(run, red_team, blue_team, layout, score, winner, secs)      winner: NULL on a draw or if both teams failed
+    team_stats(run, team, points, wins, draws, losses, errors, score_balance)
+
+Each run is added by ContestRunner.store_results, which still writes the stats_*.json file of the run (the format
+read by pacman_html_generator.py); run_stats() exports a run back in that format. Runs stored only as JSON (e.g.,
+played before the database existed) are imported with import_stats_archive().
+
+Run as a script to import a stats archive, query a team, or export a run:
+
+    python3 stats_db.py --stats-db www/stats-archive/stats.db --import-dir www/stats-archive --team <team name>
+"""
+__author__ = "Sebastian Sardina, Marco Tamassia, and Nir Lipovetzky"
+__copyright__ = "Copyright 2017-2020"
+__license__ = "GPLv3"
+
+import os
+import re
+import json
+import sqlite3
+import logging
+import argparse
+
+from config import ERROR_SCORE
+
+STATS_FILE_PATTERN = re.compile(r"^stats_([-+0-9T:.a-z]+)\.json$")
+RANDOM_LAYOUT_PREFIX = "RANDOM"
+
+# keys of the run stats stored in their own tables/columns; any other key is kept in runs.extra
+RUN_STATS_KEYS = {"games", "team_stats", "random_layouts", "fixed_layouts", "max_steps", "organizer", "timestamp_id"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    timestamp_id TEXT NOT NULL UNIQUE,
+    organizer TEXT,
+    max_steps INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS teams (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS layouts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    random INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_layouts (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    layout INTEGER NOT NULL REFERENCES layouts(id)
+);
+CREATE TABLE IF NOT EXISTS games (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    red_team INTEGER NOT NULL REFERENCES teams(id),
+    blue_team INTEGER NOT NULL REFERENCES teams(id),
+    layout INTEGER NOT NULL REFERENCES layouts(id),
+    score INTEGER,
+    winner INTEGER REFERENCES teams(id),
+    secs REAL
+);
+CREATE TABLE IF NOT EXISTS team_stats (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    team INTEGER NOT NULL REFERENCES teams(id),
+    points INTEGER,
+    wins INTEGER,
+    draws INTEGER,
+    losses INTEGER,
+    errors INTEGER,
+    score_balance INTEGER
+);
+CREATE INDEX IF NOT EXISTS run_layouts_run ON run_layouts(run);
+CREATE INDEX IF NOT EXISTS games_run ON games(run);
+CREATE INDEX IF NOT EXISTS games_red_team ON games(red_team);
+CREATE INDEX IF NOT EXISTS games_blue_team ON games(blue_team);
+CREATE INDEX IF NOT EXISTS games_layout ON games(layout);
+CREATE INDEX IF NOT EXISTS team_stats_run ON team_stats(run);
+CREATE INDEX IF NOT EXISTS team_stats_team ON team_stats(team);
+"""
+
+
+class StatsDB:
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.team_ids = {}
+        self.layout_ids = {}
+
+    def close(self):
+        self.db.close()
+
+    def _team_id(self, name):
+        if name not in self.team_ids:
+            self.db.execute("INSERT OR IGNORE INTO teams (name) VALUES (?)", (name,))
+            (self.team_ids[name],) = self.db.execute("SELECT id FROM teams WHERE name = ?", (name,)).fetchone()
+        return self.team_ids[name]
+
+    def _layout_id(self, name):
+        if name not in self.layout_ids:
+            self.db.execute(
+                "INSERT OR IGNORE INTO layouts (name, random) VALUES (?, ?)",
+                (name, int(name.startswith(RANDOM_LAYOUT_PREFIX))),
+            )
+            (self.layout_ids[name],) = self.db.execute("SELECT id FROM layouts WHERE name = ?", (name,)).fetchone()
+        return self.layout_ids[name]
+
+    def _run_id(self, timestamp_id):
+        row = self.db.execute("SELECT id FROM runs WHERE timestamp_id = ?", (timestamp_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def has_run(self, timestamp_id):
+        return self._run_id(timestamp_id) is not None
+
+    def add_run(self, data_stats, timestamp_id=None):
+        """
+        Stores the stats of a run, as written in its stats_*.json file (replacing the run if already stored).
+        """
+        timestamp_id = timestamp_id or data_stats["timestamp_id"]
+        extra = {key: value for key, value in data_stats.items() if key not in RUN_STATS_KEYS}
+        try:
+            self._add_run(timestamp_id, data_stats, extra)
+        except Exception:
+            # the transaction was rolled back, so the ids of teams and layouts added in it are not valid
+            self.team_ids = {}
+            self.layout_ids = {}
+            raise
+
+    def _add_run(self, timestamp_id, data_stats, extra):
+        with self.db:  # one transaction per run
+            self._delete_run(timestamp_id)
+            run = self.db.execute(
+                "INSERT INTO runs (timestamp_id, organizer, max_steps, extra) VALUES (?, ?, ?, ?)",
+                (timestamp_id, data_stats.get("organizer"), data_stats.get("max_steps"), json.dumps(extra)),
+            ).lastrowid
+            self.db.executemany(
+                "INSERT INTO run_layouts (run, layout) VALUES (?, ?)",
+                [
+                    (run, self._layout_id(layout))
+                    for layout in data_stats.get("fixed_layouts", []) + data_stats.get("random_layouts", [])
+                ],
+            )
+            self.db.executemany(
+                "INSERT INTO games (run, red_team, blue_team, layout, score, winner, secs) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run,
+                        self._team_id(red_team_name),
+                        self._team_id(blue_team_name),
+                        self._layout_id(layout),
+                        score,
+                        None if winner is None else self._team_id(winner),
+                        secs,
+                    )
+                    for (red_team_name, blue_team_name, layout, score, winner, secs) in data_stats["games"]
+                ],
+            )
+            self.db.executemany(
+                "INSERT INTO team_stats (run, team, points, wins, draws, losses, errors, score_balance) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (run, self._team_id(team_name), *stats)
+                    for team_name, stats in data_stats["team_stats"].items()
+                ],
+            )
+
+    def _delete_run(self, timestamp_id):
+        run = self._run_id(timestamp_id)
+        if run is None:
+            return
+        for table in ["run_layouts", "games", "team_stats"]:
+            self.db.execute("DELETE FROM %s WHERE run = ?" % table, (run,))
+        self.db.execute("DELETE FROM runs WHERE id = ?", (run,))
+
+    def import_stats_archive(self, stats_dir):
+        """
+        Adds the runs in the stats_*.json files of stats_dir not stored yet.
+        :return: number of runs imported
+        """
+        no_runs = 0
+        if not os.path.isdir(stats_dir):
+            return no_runs
+        for stats_file_name in sorted(os.listdir(stats_dir)):
+            match = STATS_FILE_PATTERN.match(stats_file_name)
+            if not match or self.has_run(match.group(1)):
+                continue
+            try:
+                with open(os.path.join(stats_dir, stats_file_name), "r") as f:
+                    data_stats = json.load(f)
+                self.add_run(data_stats, timestamp_id=match.group(1))
+                no_runs += 1
+            except (IOError, ValueError, KeyError, TypeError) as e:
+                logging.warning("Could not import stats file {} into {}: {}".format(stats_file_name, self.path, str(e)))
+        if no_runs:
+            logging.info("Stats db {} imported {} runs from {}".format(self.path, no_runs, stats_dir))
+        return no_runs
+
+    def run_stats(self, timestamp_id):
+        """
+        :return: the stats of a run in the format of its stats_*.json file, or None if the run is not stored
+        """
+        row = self.db.execute(
+            "SELECT id, organizer, max_steps, extra FROM runs WHERE timestamp_id = ?", (timestamp_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        run, organizer, max_steps, extra = row
+        layouts = [
+            (name, random)
+            for name, random in self.db.execute(
+                "SELECT l.name, l.random FROM run_layouts rl JOIN layouts l ON l.id = rl.layout WHERE rl.run = ? "
+                "ORDER BY rl.rowid",
+                (run,),
+            )
+        ]
+        games = [
+            list(game)
+            for game in self.db.execute(
+                "SELECT r.name, b.name, l.name, g.score, w.name, g.secs FROM games g "
+                "JOIN teams r ON r.id = g.red_team JOIN teams b ON b.id = g.blue_team "
+                "JOIN layouts l ON l.id = g.layout LEFT JOIN teams w ON w.id = g.winner "
+                "WHERE g.run = ? ORDER BY g.rowid",
+                (run,),
+            )
+        ]
+        team_stats = {
+            name: list(stats)
+            for name, *stats in self.db.execute(
+                "SELECT t.name, s.points, s.wins, s.draws, s.losses, s.errors, s.score_balance FROM team_stats s "
+                "JOIN teams t ON t.id = s.team WHERE s.run = ? ORDER BY s.rowid",
+                (run,),
+            )
+        }
+        return {
+            "games": games,
+            "team_stats": team_stats,
+            "random_layouts": [name for name, random in layouts if random],
+            "fixed_layouts": [name for name, random in layouts if not random],
+            "max_steps": max_steps,
+            "organizer": organizer,
+            "timestamp_id": timestamp_id,
+            **json.loads(extra or "{}"),
+        }
+
+    def team_layout_stats(self, team_name, group_random=True):
+        """
+        :param group_random: if True, all random layouts are reported together as RANDOM
+        :return: the games, wins, draws, losses and errors of a team in each layout over all runs, as a list of
+            (layout, games, wins, draws, losses, errors), with the most played layouts first
+        """
+        layout_name = "CASE WHEN l.random THEN '%s' ELSE l.name END" % RANDOM_LAYOUT_PREFIX if group_random else "l.name"
+        return self.db.execute(
+            "SELECT {layout_name} AS layout_name, COUNT(*), "
+            "SUM(g.winner IS t.id), "
+            "SUM(g.winner IS NULL AND g.score != :error_score), "
+            "SUM(g.winner IS NOT NULL AND g.winner != t.id), "
+            "SUM(g.score = :error_score AND g.winner IS NOT t.id) "
+            "FROM teams t JOIN ("
+            "  SELECT * FROM games WHERE red_team = (SELECT id FROM teams WHERE name = :team) "
+            "  UNION ALL "
+            "  SELECT * FROM games WHERE blue_team = (SELECT id FROM teams WHERE name = :team)"
+            ") g JOIN layouts l ON l.id = g.layout "
+            "WHERE t.name = :team GROUP BY layout_name ORDER BY COUNT(*) DESC, layout_name".format(
+                layout_name=layout_name
+            ),
+            {"team": team_name, "error_score": ERROR_SCORE},
+        ).fetchall()
+
+    def game_durations(self, max_steps):
+        """
+        :return: (red team, blue team, layout, secs) of every game stored played with the given number of steps
+        """
+        return self.db.execute(
+            "SELECT r.name, b.name, l.name, g.secs FROM games g JOIN runs ON runs.id = g.run "
+            "JOIN teams r ON r.id = g.red_team JOIN teams b ON b.id = g.blue_team JOIN layouts l ON l.id = g.layout "
+            "WHERE runs.max_steps = ?",
+            (max_steps,),
+        ).fetchall()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s %(levelname)-8s %(message)s", level=logging.INFO,
+                        datefmt="%a, %d %b %Y %H:%M:%S")
+    parser = argparse.ArgumentParser(description="Imports and queries the stats db of the contest runs.")
+    parser.add_argument("--stats-db", required=True, help="stats db file (e.g., www/stats-archive/stats.db).")
+    parser.add_argument("--import-dir", help="import the stats_*.json files of this dir not stored yet.")
+    parser.add_argument("--team", help="print the results of this team per layout over all runs.")
+    parser.add_argument("--export", metavar="RUN_ID", help="print the stats of this run as JSON.")
+    args = parser.parse_args()
+
+    stats_db = StatsDB(args.stats_db)
+    if args.import_dir:
+        stats_db.import_stats_archive(args.import_dir)
+    if args.team:
+        print("%-20s %6s %6s %6s %6s %6s %9s" % ("layout", "games", "wins", "draws", "losses", "errors", "win rate"))
+        for layout, no_games, wins, draws, losses, errors in stats_db.team_layout_stats(args.team):
+            print("%-20s %6d %6d %6d %6d %6d %8.1f%%" % (layout, no_games, wins, draws, losses, errors,
+                                                        100.0 * wins / no_games))
+    if args.export:
+        print(json.dumps(stats_db.run_stats(args.export)))
+    stats_db.close()
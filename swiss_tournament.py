@@ -0,0 +1,154 @@
+"""
+SwissTournament plays a sampled tournament in rounds, instead of the full round robin of every pair of teams in every
+layout, which is too many games for large cohorts (150 teams in 6 layouts are 67k games).
+
+In each round every team plays (at most) one game, against the closest team in the current ranking it has not met yet
+(Swiss system), in a layout it has played the least. The ranking is the Bradley-Terry strength of each team fitted on
+all the games so far (a draw counts as half a win for each team). The tournament stops when every team has played the
+number of games given, or earlier, once the confidence intervals of the strengths of every two adjacent teams in the
+ranking do not overlap (so more games would not change the ranking).
+
+The pairings only depend on the games played, so a run resumed plays the same rounds again (see ContestRunner).
+"""
+__author__ = "Sebastian Sardina, Marco Tamassia, and Nir Lipovetzky"
+__copyright__ = "Copyright 2017-2020"
+__license__ = "GPLv3"
+
+import math
+import logging
+
+from config import ERROR_SCORE
+
+CONFIDENCE_Z = 1.96  # 95% confidence intervals
+PRIOR_GAMES = 1  # virtual win and loss of each team against an average team, so strengths are always defined
+
+
+class SwissTournament:
+    def __init__(self, team_names, layouts, games_per_team):
+        """
+        :param team_names: the names of the teams, in the order used to break ties in the first round
+        :param layouts: the layouts the games are played in
+        :param games_per_team: the maximum number of games (rounds) of each team
+        """
+        self.team_names = list(team_names)
+        self.layouts = list(layouts)
+        self.games_per_team = games_per_team
+        self.no_rounds = 0
+
+    def no_games(self):
+        """
+        :return: the number of games played if the tournament is not stopped early
+        """
+        return self.games_per_team * (len(self.team_names) // 2)
+
+    def next_round(self, games):
+        """
+        :param games: the games played so far, as in ContestRunner.games: (red, blue, layout, score, winner, secs)
+        :return: the games of the next round as (red team name, blue team name, layout), or [] if the tournament is over
+        """
+        if self.no_rounds >= self.games_per_team or len(self.team_names) < 2:
+            return []
+        strengths, errors = self.fit(games)
+        if self.no_rounds >= self._min_rounds() and self.separated(strengths, errors):
+            logging.info("Swiss tournament: ranking separated after {} rounds".format(self.no_rounds))
+            return []
+        self.no_rounds += 1
+
+        met = {}  # (team, team) sorted -> layouts played
+        layouts_played = {team_name: {layout: 0 for layout in self.layouts} for team_name in self.team_names}
+        for (red_team_name, blue_team_name, layout, _, _, _) in games:
+            met.setdefault(tuple(sorted((red_team_name, blue_team_name))), set()).add(layout)
+            for team_name in (red_team_name, blue_team_name):
+                if team_name in layouts_played and layout in layouts_played[team_name]:
+                    layouts_played[team_name][layout] += 1
+
+        # strongest first; ties (e.g., first round) broken by the order of the teams given
+        ranking = sorted(self.team_names, key=lambda t: (-strengths[t], self.team_names.index(t)))
+        pairings = []
+        unpaired = list(ranking)
+        while len(unpaired) > 1:
+            team_name = unpaired.pop(0)
+            for opponent_name in sorted(
+                unpaired, key=lambda o: (len(met.get(tuple(sorted((team_name, o))), ())), unpaired.index(o))
+            ):
+                layouts_left = [l for l in self.layouts if l not in met.get(tuple(sorted((team_name, opponent_name))), ())]
+                if not layouts_left:
+                    continue
+                layout = min(
+                    layouts_left,
+                    key=lambda l: (layouts_played[team_name][l] + layouts_played[opponent_name][l],
+                                   self.layouts.index(l)),
+                )
+                unpaired.remove(opponent_name)
+                # alternate colours, so no team is always red
+                if self.no_rounds % 2:
+                    pairings.append((team_name, opponent_name, layout))
+                else:
+                    pairings.append((opponent_name, team_name, layout))
+                break
+        logging.info(
+            "Swiss tournament: round {} with {} games ({} teams with no game)".format(
+                self.no_rounds, len(pairings), len(self.team_names) - 2 * len(pairings)
+            )
+        )
+        return pairings
+
+    def _min_rounds(self):
+        # rounds needed for the Swiss pairings to sort the teams before the ranking can be trusted
+        return min(self.games_per_team, max(1, math.ceil(math.log2(len(self.team_names)))))
+
+    def fit(self, games, iterations=200):
+        """
+        Fits the Bradley-Terry strength of each team (MM algorithm) on the games given.
+        :return: the strength (log scale) of each team, and its standard error
+        """
+        wins = {team_name: float(PRIOR_GAMES) for team_name in self.team_names}
+        no_games = {}  # (team, team) -> games between them (a draw counts as half a win for each)
+        for (red_team_name, blue_team_name, _, score, winner, _) in games:
+            if red_team_name not in wins or blue_team_name not in wins:
+                continue
+            if score == ERROR_SCORE and winner is None:
+                continue  # both teams failed: no information
+            key = tuple(sorted((red_team_name, blue_team_name)))
+            no_games[key] = no_games.get(key, 0) + 1
+            if winner is None:
+                wins[red_team_name] += 0.5
+                wins[blue_team_name] += 0.5
+            else:
+                wins[winner] += 1
+
+        opponents = {team_name: [] for team_name in self.team_names}
+        for (team_name, opponent_name), n in no_games.items():
+            opponents[team_name].append((opponent_name, n))
+            opponents[opponent_name].append((team_name, n))
+
+        # the prior games (PRIOR_GAMES won and lost) are played against a virtual team of strength 1
+        strength = {team_name: 1.0 for team_name in self.team_names}
+        for _ in range(iterations):
+            strength = {
+                team_name: wins[team_name] / (
+                    2 * PRIOR_GAMES / (strength[team_name] + 1)
+                    + sum(n / (strength[team_name] + strength[o]) for o, n in opponents[team_name])
+                )
+                for team_name in self.team_names
+            }
+
+        errors = {}
+        for team_name in self.team_names:
+            p = strength[team_name]
+            information = 2 * PRIOR_GAMES * p / (p + 1) ** 2 + sum(
+                n * p * strength[o] / (p + strength[o]) ** 2 for o, n in opponents[team_name]
+            )
+            errors[team_name] = 1 / math.sqrt(information)
+        return {team_name: math.log(strength[team_name]) for team_name in self.team_names}, errors
+
+    @staticmethod
+    def separated(strengths, errors):
+        """
+        :return: True if the confidence intervals of every two adjacent teams in the ranking do not overlap
+        """
+        ranking = sorted(strengths, key=strengths.get, reverse=True)
+        return all(
+            strengths[a] - CONFIDENCE_Z * errors[a] > strengths[b] + CONFIDENCE_Z * errors[b]
+            for a, b in zip(ranking, ranking[1:])
+        )